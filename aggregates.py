@@ -0,0 +1,100 @@
+"""
+Province x product aggregation cube feeding the charts.
+
+Sum, mean, count, min and max of every product's producing regions are
+computed once per province from the product matrix. Top-product
+statistics per (province, top product) are built once per ranked
+product subset and memoized. Charts slice these small tables instead of
+regrouping ``map_data`` on every rerun.
+"""
+import numpy as np
+import pandas as pd
+
+STATS = ["sum", "mean", "count", "min", "max"]
+
+
+def _select(frame, provinces):
+    if provinces is None:
+        return frame.reset_index(drop=True)
+    return frame[frame["Province"].isin(provinces)].reset_index(drop=True)
+
+
+class AggregationCube:
+    """Per-province statistics over a ``ProductMatrix``, keyed by product code."""
+
+    def __init__(self, matrix, province_index, top_subsets=()):
+        self.matrix = matrix
+        self.provinces = list(province_index)
+
+        n_provinces, n_products = len(self.provinces), matrix.values.shape[1]
+        self.sum = np.zeros((n_provinces, n_products), dtype=np.float64)
+        self.count = np.zeros((n_provinces, n_products), dtype=np.int64)
+        self.min = np.zeros((n_provinces, n_products), dtype=np.float64)
+        self.max = np.zeros((n_provinces, n_products), dtype=np.float64)
+
+        # Province code of every row (-1 for rows without a province)
+        self.row_province = np.full(matrix.n_regions, -1, dtype=np.intp)
+
+        for i, province in enumerate(self.provinces):
+            positions = province_index[province]
+            self.row_province[positions] = i
+            values = matrix.values[positions]
+            producing = values > 0
+            self.sum[i] = values.sum(axis=0, dtype=np.float64)
+            self.count[i] = producing.sum(axis=0)
+            if len(positions):
+                self.min[i] = np.where(producing, values, np.inf).min(axis=0)
+                self.max[i] = values.max(axis=0)
+        self.min[self.count == 0] = 0
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean = np.where(self.count > 0, self.sum / np.maximum(self.count, 1), 0.0)
+
+        self._top_cache = {}
+        for codes in top_subsets:
+            self.top_product_stats(codes)
+
+    def product_stats(self, code, provinces=None):
+        """Per-province statistics of one product, for provinces that produce it."""
+        j = self.matrix.code_index[code]
+        frame = pd.DataFrame({
+            "Province": self.provinces,
+            "sum": self.sum[:, j],
+            "mean": self.mean[:, j],
+            "count": self.count[:, j],
+            "min": self.min[:, j],
+            "max": self.max[:, j],
+        })
+        return _select(frame[frame["count"] > 0], provinces)
+
+    def top_product_stats(self, codes, provinces=None):
+        """
+        Statistics of the top-product value per (province, top product).
+
+        Each region contributes its rank-1 product among ``codes``. Columns
+        are ``Province``, ``Product`` (code) and the ``STATS``.
+        """
+        key = tuple(dict.fromkeys(codes))
+        if key not in self._top_cache:
+            top_codes, top_values = self.matrix.top_k(key, k=1)
+            rows = (top_values[:, 0] > 0) & (self.row_province >= 0)
+            regions = pd.DataFrame({
+                "Province": np.asarray(self.provinces, dtype=object)[self.row_province[rows]],
+                "Product": top_codes[rows, 0],
+                "value": top_values[rows, 0].astype(np.float64),
+            })
+            self._top_cache[key] = (
+                regions.groupby(["Province", "Product"])["value"]
+                .agg(STATS)
+                .reset_index()
+            )
+        return _select(self._top_cache[key], provinces)
+
+    def top_province_stats(self, codes, provinces=None):
+        """Per-province statistics of the top-product value across all top products."""
+        stats = self.top_product_stats(codes, provinces)
+        totals = stats.groupby("Province").agg(
+            sum=("sum", "sum"), count=("count", "sum"), min=("min", "min"), max=("max", "max")
+        ).reset_index()
+        totals["mean"] = totals["sum"] / totals["count"]
+        return totals[["Province"] + STATS]
@@ -1,11 +1,26 @@
+import importlib
+import logging
+import os
+import threading
+
 import streamlit as st
-import geopandas as gpd
-import folium
-from streamlit_folium import st_folium
+import numpy as np
 import pandas as pd
-import plotly.express as px
-from pathlib import Path
-import branca.colormap as cm
+
+from catalog import CATEGORIES, CATEGORY_PRODUCTS, category_codes, category_groups, product_column
+
+import aggregates
+import data_store
+import export
+import geometry
+import map_payload
+import pipeline
+import product_matrix
+import profiling
+import region_table
+import render_cache
+import spatial_index
+import viewport
 
 # ====================================================================
 # Page Configuration
@@ -17,6 +32,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Opt-in section timing (ATLAS_PROFILE=1 or ?profile=1)
+profiler = profiling.Profiler(enabled=profiling.profiling_requested(st.query_params.get("profile")))
+
 # Custom CSS for better styling
 st.markdown("""
     <style>
@@ -43,237 +61,143 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# ====================================================================
-# Product Dictionaries
-# ====================================================================
-HA_FIELD_CROPS = {
-    "ALFALFA": "Alfalfa and alfalfa mixtures",
-    "BARLEY": "Barley",
-    "BUCWHT": "Buckwheat",
-    "CANARY": "Canary seed",
-    "CANOLA": "Canola (rapeseed)",
-    "CHICPEA": "Chick peas",
-    "CORNGR": "Corn for grain",
-    "CORNSI": "Corn for silage",
-    "DFPEAS": "Dry field peas",
-    "FABABN": "Faba beans",
-    "FLAXSD": "Flaxseed",
-    "FORAGE": "Forage seed for seed",
-    "GINSENG": "Ginseng",
-    "HEMP": "Hemp",
-    "LENTIL": "Lentils",
-    "MUSTSD": "Mustard seed",
-    "MXDGRN": "Mixed grains",
-    "OATS": "Oats",
-    "ODFBNS": "Other dry beans",
-    "OFIELD": "Other field crops",
-    "OTTAME": "All other tame hay and fodder crops",
-    "POTATS": "Potatoes",
-    "RYEFAL": "Fall rye",
-    "RYESPG": "Spring rye",
-    "SOYBNS": "Soybeans",
-    "SUGARB": "Sugar beets",
-    "SUNFLS": "Sunflowers",
-    "TRITCL": "Triticale",
-    "WHITBN": "Dry white beans",
-    "WHTDUR": "Durum wheat",
-    "WHTSPG": "Spring wheat (excluding durum)",
-    "WHTWIN": "Winter wheat",
-}
-
-HA_VEGETABLES = {
-    "ASPNPRD": "Asparagus non-producing",
-    "ASPPROD": "Asparagus producing",
-    "BEANS": "Beans",
-    "BEETS": "Beets",
-    "BROCLI": "Broccoli",
-    "BRSPRT": "Brussels sprouts",
-    "CABAGE": "Cabbage",
-    "CARROT": "Carrots",
-    "CELERY": "Celery",
-    "CHINCABG": "Chinese cabbage",
-    "CLFLWR": "Cauliflower",
-    "CUCUMB": "Cucumbers",
-    "GARLIC": "Garlic",
-    "GRPEAS": "Green peas",
-    "KALE": "Kale",
-    "LETUCE": "Lettuce",
-    "ONIONS": "Onions",
-    "PEPPER": "Peppers",
-    "PUMPKIN": "Pumpkins",
-    "RADISH": "Radishes",
-    "RHUBARB": "Rhubarb",
-    "RTBAGA": "Rutabagas",
-    "SHALOT": "Shallots",
-    "SPNACH": "Spinach",
-    "SQUAZUC": "Squash and zucchini",
-    "SWCORN": "Sweet corn",
-    "TOMATO": "Tomatoes",
-}
-
-HA_FRUITS_BERRIES = {
-    "APCTTA": "Apricots",
-    "APPLETA": "Apples",
-    "BLUEBTA": "Blueberries",
-    "CRANBTA": "Cranberries",
-    "CURRANT": "Blackcurrants, redcurrants and whitecurrants",
-    "GRAPETA": "Grapes",
-    "HASKAPTA": "Haskaps",
-    "HBLUEBTA": "Blueberries, highbush",
-    "LBLUEBTA": "Blueberries, lowbush",
-    "PEARTA": "Pears",
-    "PECHTA": "Peaches",
-    "PLUMTA": "Plums",
-    "RASPBTA": "Raspberries",
-    "SASKBTA": "Saskatoons",
-    "SRCHTA": "Sour cherries",
-    "STRWBTA": "Strawberries",
-    "SWCHTA": "Sweet cherries",
-    "OTFRTTA": "Other fruits, berries and nuts",
-}
-
-GREENHOUSE_PRODUCTS = {
-    "GRNCUCUMB": "Greenhouse cucumbers",
-    "GRNFLOWER": "Cut flowers",
-    "GRNHERB": "Greenhouse herbs",
-    "GRNOTHER": "Other greenhouse products",
-    "GRNOTHVEG": "Other greenhouse fruits and vegetables",
-    "GRNPEPPER": "Greenhouse peppers",
-    "GRNPLANTS": "Potted plants, indoor or outdoor",
-    "GRNTOMATO": "Greenhouse tomatoes",
-}
-
-LIVESTOCK_ANIMALS = {
-    "BFCOWS": "Beef cows",
-    "BFHEIF": "Heifers for beef herd replacement",
-    "BISON": "Bison (buffalo)",
-    "BOARS": "Boars",
-    "BULLS": "Bulls, 1 year and over",
-    "CALFU1": "Calves under 1 year",
-    "DEER": "Deer",
-    "DONKEYS": "Donkeys",
-    "ELK": "Elk",
-    "EWES": "Ewes",
-    "FDHEIF": "Heifers for dairy herd replacement",
-    "GOATS": "Goats",
-    "GRWPIG": "Growing pigs",
-    "HORSES": "Horses",
-    "LAMAS": "Llamas and alpacas",
-    "LAMBS": "Lambs",
-    "MINK": "Mink",
-    "MKTLAMBS": "Market lambs",
-    "MLKCOW": "Milk cows",
-    "MLKHEIF": "Milk heifers",
-    "NRSPIG": "Nursing pigs",
-    "RABBIT": "Rabbits",
-    "RAMS": "Rams",
-    "REPLAMBS": "Replacement lambs",
-    "SOWS": "Sows and gilts for breeding",
-    "STEERS": "Steers, 1 year and over",
-    "WEANPIG": "Weaner pigs",
-}
-
-POULTRY = {
-    "BREEDCHK": "Layer and broiler breeders",
-    "BROILER": "Broilers, roasters and Cornish",
-    "DUCK": "Ducks",
-    "GEESE": "Geese",
-    "HATCHNUM": "Chicks or other poultry hatched",
-    "LAYHEN": "Laying hens, 19 weeks and over",
-    "OTHPLT": "Other poultry",
-    "PULETS": "Pullets under 19 weeks",
-    "TURKEY": "Turkeys",
-}
-
-# Map categories to their product dictionaries
-CATEGORY_PRODUCTS = {
-    "🌾 Field Crops": HA_FIELD_CROPS,
-    "🥬 Vegetables": HA_VEGETABLES,
-    "🍓 Fruits & Berries": HA_FRUITS_BERRIES,
-    "🏡 Greenhouse Products": GREENHOUSE_PRODUCTS,
-    "🐄 Livestock": LIVESTOCK_ANIMALS,
-    "🐔 Poultry": POULTRY,
-}
-
 # ====================================================================
 # Data Loading
 # ====================================================================
-@st.cache_data
+@st.cache_resource
 def load_data():
-    """Load agricultural statistics data."""
+    """
+    Load region geometry, names and provinces; product values live in the product matrix.
+    
+    The frame is shared across reruns and sessions without copying, so
+    callers must treat it as read-only.
+    """
     try:
-        # Load ADM2 agricultural data
-        adm2_path = Path("data/canada_adm2_agricultural_stats.geojson")
-        if not adm2_path.exists():
-            st.error(f"Data file not found at {adm2_path}")
-            st.stop()
-        
-        adm2 = gpd.read_file(adm2_path)
-        
-        # Convert to WGS84 for web mapping
-        if adm2.crs != "EPSG:4326":
-            adm2 = adm2.to_crs("EPSG:4326")
+        # Compiled columnar cache, rebuilt when the source GeoJSON changes
+        adm2 = data_store.load_columns([])
         
+        # Store the key columns in the smallest lossless dtypes
+        adm2, footprint = data_store.compact_frame(adm2, keep=data_store.KEY_COLUMNS)
+        adm2.attrs["footprint"] = footprint
         return adm2
+    except FileNotFoundError as e:
+        st.error(str(e))
+        st.stop()
     except Exception as e:
         st.error(f"Error loading data: {e}")
         st.stop()
 
-adm2_data = load_data()
+@st.cache_resource
+def load_geometry_pyramid():
+    """Precompute simplified geometries for each zoom level; full resolution is the shared frame's geometry."""
+    return geometry.build_geometry_pyramid(load_data().geometry)
 
-# ====================================================================
-# Category Configuration
-# ====================================================================
-CATEGORIES = {
-    "🌾 Field Crops": {
-        "columns": ("top_field_crop", "top_field_crop_value"),
-        "color": "YlOrRd",
-        "description": "Major field crops including wheat, canola, barley, and more",
-        "unit": "hectares"
-    },
-    "🥬 Vegetables": {
-        "columns": ("top_vegetable", "top_vegetable_value"),
-        "color": "Greens",
-        "description": "Vegetable production including lettuce, carrots, tomatoes, and more",
-        "unit": "hectares"
-    },
-    "🍓 Fruits & Berries": {
-        "columns": ("top_fruit_berry", "top_fruit_berry_value"),
-        "color": "RdPu",
-        "description": "Fruit and berry production including apples, blueberries, strawberries",
-        "unit": "hectares"
-    },
-    "🏡 Greenhouse Products": {
-        "columns": ("top_greenhouse", "top_greenhouse_value"),
-        "color": "Purples",
-        "description": "Greenhouse production including tomatoes, cucumbers, peppers, flowers",
-        "unit": "hectares"
-    },
-    "🐄 Livestock": {
-        "columns": ("top_livestock", "top_livestock_value"),
-        "color": "YlOrBr",
-        "description": "Livestock including beef cattle, dairy cows, pigs, sheep, and more",
-        "unit": "count"
-    },
-    "🐔 Poultry": {
-        "columns": ("top_poultry", "top_poultry_value"),
-        "color": "Oranges",
-        "description": "Poultry production including chickens, turkeys, ducks, geese",
-        "unit": "count"
-    },
-    "🌱 All Crops": {
-        "columns": ("top_crop", "top_crop_value"),
-        "color": "YlGn",
-        "description": "Overall dominant crop across all categories",
-        "unit": "hectares"
-    },
-    "🐮 All Animals": {
-        "columns": ("top_animal", "top_animal_value"),
-        "color": "BuPu",
-        "description": "Overall dominant animal production (livestock + poultry)",
-        "unit": "count"
-    },
-}
+@st.cache_resource
+def load_product_matrix():
+    """
+    Pack every product column into one float32 regions x products matrix.
+
+    With ``ATLAS_SHARED_MATRIX=1`` the matrix is memory-mapped read-only
+    from the on-disk store, shared by every server process on the host.
+    """
+    if data_store.SHARED_MATRIX:
+        return data_store.load_shared_matrix()
+    return product_matrix.build_product_matrix(data_store.load_columns(product_matrix.matrix_columns()))
+
+@st.cache_resource
+def load_province_index():
+    """Precompute the row positions of each province's divisions."""
+    return data_store.province_row_index(load_data())
+
+@st.cache_resource
+def load_aggregation_cube():
+    """Precompute province x product statistics, plus top-product statistics for every category."""
+    return aggregates.AggregationCube(
+        load_product_matrix(),
+        load_province_index(),
+        top_subsets=[category_codes(category) for category in CATEGORIES]
+    )
+
+@st.cache_resource
+def load_province_boundaries():
+    """Dissolve and simplify province outlines once, shared across reruns."""
+    return geometry.build_province_boundaries(load_data())
+
+@st.cache_resource
+def load_region_index():
+    """STRtree over region polygons for click-to-inspect and viewport lookups."""
+    return spatial_index.RegionIndex(load_data().geometry.values)
+
+@st.cache_resource
+def load_region_table():
+    """Equal-area centroids, bounds and areas of every region and province, for map fitting and densities."""
+    return region_table.RegionTable(load_data().geometry, load_province_index())
+
+@st.cache_resource
+def load_render_cache():
+    """Process-wide LRU cache of built folium map objects, bounded by their estimated size."""
+    return render_cache.RenderCache()
+
+@st.cache_resource
+def start_tile_service():
+    """Start the in-process vector tile endpoint once per server process."""
+    import tiles
+
+    source = tiles.TileSource(load_geometry_pyramid())
+    tiles.start_tile_server(source)
+    return source
+
+def cache_map(map_cache, key, m, map_entry):
+    """Store a built map; its lock serializes ``st_folium`` calls, which add layers to the shared map."""
+    map_entry['map'] = m
+    map_entry['lock'] = threading.Lock()
+    map_cache.put(key, map_entry, pipeline.cached_map_size(map_entry))
+    return map_entry
+
+def warm_up():
+    """Precompute the shared data, aggregates and every category's default map."""
+    try:
+        # Heavy modules the first page view would otherwise import
+        for module in ("folium", "branca.colormap", "plotly.express"):
+            importlib.import_module(module)
+
+        adm2_data = load_data()
+        matrix = load_product_matrix()
+        load_aggregation_cube()
+        pyramid = load_geometry_pyramid()
+        boundaries = load_province_boundaries()
+        regions = load_region_table()
+        map_cache = load_render_cache()
+        all_rows = np.arange(len(adm2_data))
+
+        for category in CATEGORIES:
+            view = pipeline.make_view(category)
+            key = pipeline.map_cache_key(view)
+            if key in map_cache:
+                continue
+            map_data, _ = pipeline.view_data(view, adm2_data, matrix, all_rows)
+            if map_data.empty:
+                continue
+            m, map_entry = pipeline.build_map(
+                view, map_data, pyramid, province_boundaries=boundaries,
+                viewport_culling=viewport.culling_enabled(len(map_data)), regions=regions
+            )
+            cache_map(map_cache, key, m, map_entry)
+    except Exception:
+        # The page loads the same resources itself and reports any errors to the user
+        logging.getLogger(__name__).exception("Background warm-up failed")
+        return
+
+@st.cache_resource
+def start_warm_up():
+    """Run the warm-up once per server process on a background thread."""
+    thread = threading.Thread(target=warm_up, name="atlas-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+# Warm every category's default view in the background (ATLAS_WARMUP=0 disables)
+if os.environ.get("ATLAS_WARMUP", "1") != "0":
+    start_warm_up()
 
 # ====================================================================
 # Sidebar
@@ -311,6 +235,7 @@ analysis_mode = st.sidebar.radio(
 selected_product = None
 selected_product_col = None
 selected_product_label = None
+show_density = False
 
 if analysis_mode == "Specific Product Distribution":
     # Get products for the selected category
@@ -329,17 +254,48 @@ if analysis_mode == "Specific Product Distribution":
         selected_product = product_options[selected_product_label]
         
         # Handle _HA suffix for greenhouse products
-        if selected_category == "🏡 Greenhouse Products":
-            selected_product_col = f"{selected_product}_HA"
-        else:
-            selected_product_col = selected_product
+        selected_product_col = product_column(selected_category, selected_product)
         
         st.sidebar.success(f"🔎 Showing: **{selected_product_label}**")
+
+        show_density = st.sidebar.toggle(
+            "Production per km²",
+            value=False,
+            help="Color regions by production per square kilometre of land instead of total production"
+        )
     elif selected_category in ["🌱 All Crops", "🐮 All Animals"]:
         st.sidebar.info("💡 Select a specific category (Field Crops, Vegetables, etc.) to view individual products")
         analysis_mode = "Top Product per Region"  # Force back to top product mode
 
+selected_group = None
+top_k = 1
+
+if analysis_mode == "Top Product per Region":
+    # Rank any category or product grouping on the fly
+    group_options = ["All products"] + category_groups(selected_category)
+    group_choice = st.sidebar.selectbox(
+        "Rank Products From",
+        options=group_options,
+        help="Rank the whole category or a narrower product group"
+    )
+    if group_choice != "All products":
+        selected_group = group_choice
+    
+    top_k = st.sidebar.slider(
+        "Products per Region",
+        min_value=1,
+        max_value=3,
+        value=1,
+        help="Show the top N products for each region on hover"
+    )
+
 st.sidebar.markdown("---")
+profiler.lap("sidebar")
+
+# Geometry and names are shared; product values come from the product matrix
+adm2_data = load_data()
+matrix = load_product_matrix()
+profiler.lap("load")
 
 # ====================================================================
 # Province filter
@@ -348,7 +304,8 @@ st.sidebar.markdown("### 🗺️ Region Filter")
 
 # Get unique provinces from ADM2 data
 if 'Province' in adm2_data.columns:
-    available_provinces = sorted(adm2_data['Province'].dropna().unique().tolist())
+    province_index = load_province_index()
+    available_provinces = sorted(province_index.keys())
     available_provinces.insert(0, "All Canada")
     
     selected_provinces = st.sidebar.multiselect(
@@ -358,45 +315,53 @@ if 'Province' in adm2_data.columns:
         help="Select one or more provinces to filter the map"
     )
     
-    # Filter data
-    if "All Canada" in selected_provinces or len(selected_provinces) == 0:
-        map_data = adm2_data.copy()
-    else:
-        map_data = adm2_data[adm2_data['Province'].isin(selected_provinces)].copy()
-        st.sidebar.info(f"Showing {len(map_data)} regions")
+    # Filter to row positions; the shared frame is only sliced once below
+    row_positions = pipeline.filter_rows(province_index, len(adm2_data), selected_provinces)
+    if not pipeline.is_all_canada(selected_provinces):
+        st.sidebar.info(f"Showing {len(row_positions)} regions")
 else:
     st.sidebar.error("Province field not found in data.")
     selected_provinces = ["All Canada"]
-    map_data = adm2_data.copy()
+    row_positions = np.arange(len(adm2_data))
+
+# Province rows before the value filter, for full-width exports
+province_positions = row_positions
 
 # Filter out regions with no data for selected category/product
 if analysis_mode == "Top Product per Region":
-    map_data = map_data[map_data[col_value] > 0].copy()
     display_col = col_name
     value_col = col_value
 else:
     # For specific product, filter by that column
-    if selected_product_col and selected_product_col in map_data.columns:
-        map_data[selected_product_col] = pd.to_numeric(map_data[selected_product_col], errors='coerce').fillna(0)
-        map_data = map_data[map_data[selected_product_col] > 0].copy()
+    if selected_product in matrix:
         display_col = selected_product_col
         value_col = selected_product_col
     else:
         st.error(f"Product column '{selected_product_col}' not found in data")
+        # The map is not drawn, so the browser's region layer goes away
+        st.session_state.pop("atlas_viewport", None)
         st.stop()
 
-# Display options
-st.sidebar.markdown("---")
-st.sidebar.markdown("### Display Options")
-show_values = st.sidebar.checkbox("Show values on hover", value=True)
-show_boundaries = st.sidebar.checkbox("Show province boundaries", value=True)
+if analysis_mode == "Top Product per Region":
+    ranked_codes = pipeline.ranked_codes(selected_category, selected_group)
+    # Rank 1 fills the category's top columns; ranks 2+ get numbered columns
+    map_data, row_positions, rank_columns = pipeline.top_product_view(
+        adm2_data, matrix, row_positions, ranked_codes, col_name, col_value, top_k
+    )
+else:
+    map_data, row_positions = pipeline.product_view(adm2_data, matrix, row_positions, selected_product, value_col)
+    if show_density:
+        pipeline.add_density(map_data, row_positions, load_region_table(), value_col)
+profiler.lap("filter")
 
 # ====================================================================
 # Main Header
 # ====================================================================
 region_text = "All Canada" if "All Canada" in selected_provinces or len(selected_provinces) == 0 else ", ".join(selected_provinces)
 
-if analysis_mode == "Top Product per Region":
+if analysis_mode == "Top Product per Region" and selected_group:
+    st.title(f"{selected_group} Distribution")
+elif analysis_mode == "Top Product per Region":
     st.title(f"{selected_category.split()[1] if len(selected_category.split()) > 1 else selected_category} Distribution")
 else:
     st.title(f"{selected_product_label} Distribution")
@@ -440,12 +405,12 @@ if len(map_data) > 0:
     
     else:
         # For specific product distribution
-        top_region_row = map_data.nlargest(1, value_col).iloc[0]
+        top_region_row = map_data.loc[matrix.top_regions(selected_product, row_positions, k=1)[0]]
         top_region_name = top_region_row['shapeName']
         top_region_value = top_region_row[value_col]
         top_region_province = top_region_row.get('Province', 'N/A')
         
-        total_production = map_data[value_col].sum()
+        total_production = matrix.column(selected_product)[row_positions].sum(dtype=np.float64)
         num_regions = len(map_data)
         
         col_m1, col_m2, col_m3 = st.columns(3)
@@ -479,501 +444,389 @@ else:
         st.warning(f"⚠️ No data available for {selected_category} in the selected region(s).")
     else:
         st.warning(f"⚠️ No data available for {selected_product_label} in the selected region(s).")
+    # The map is not drawn, so the browser's region layer goes away
+    st.session_state.pop("atlas_viewport", None)
     st.stop()
+profiler.lap("metrics")
 
 # ====================================================================
-# Map and Legend Layout
+# Section Inputs
 # ====================================================================
-col_map, col_legend = st.columns([3, 1])
+# Every section below is a fragment that reruns on its own when one of its
+# widgets changes, so sections receive their inputs explicitly.
+view = pipeline.make_view(
+    selected_category,
+    analysis_mode,
+    product=selected_product,
+    provinces=selected_provinces,
+    group=selected_group,
+    top_k=top_k,
+    density=show_density,
+)
+
+# Charts slice the precomputed province x product statistics
+top_product_stats, province_totals = pipeline.chart_inputs(view, load_aggregation_cube())
+profiler.lap("aggregates")
 
 # ====================================================================
-# Map Column
+# Map and Legend
 # ====================================================================
-with col_map:
-    st.subheader("Interactive Map")
-    
-    # Calculate map center and zoom
-    if len(selected_provinces) > 0 and "All Canada" not in selected_provinces:
-        center_lat = map_data.geometry.centroid.y.mean()
-        center_lon = map_data.geometry.centroid.x.mean()
-        zoom_start = 6
-    else:
-        center_lat = 56.1304
-        center_lon = -106.3468
-        zoom_start = 4
-    
-    # Create folium map with dark basemap
-    m = folium.Map(
-        location=[center_lat, center_lon],
-        zoom_start=zoom_start,
-        tiles="https://{s}.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}{r}.png",
-        attr='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors &copy; <a href="https://carto.com/attributions">CARTO</a>',
-        control_scale=True
+def viewport_delta(map_key, map_entry, map_data):
+    """
+    Feature group with the regions that came into view since the last update.
+
+    Reads the bounds and zoom the map reported on its previous rerun and
+    tracks what this session's browser layer already holds. Returns
+    ``(group or None, payload_bytes, sent)``.
+    """
+    map_state = st.session_state.get("atlas_map")
+    pyramid = load_geometry_pyramid()
+    region_index = load_region_index()
+
+    # No reported state means a freshly mounted map with an empty layer
+    sent = st.session_state.get("atlas_viewport") if map_state else None
+    zoom = (map_state or {}).get("zoom") or map_entry['zoom_start']
+    bounds = viewport.bounds_from_state(map_state)
+    if sent is None or sent.map_key != map_key or bounds is None:
+        # A new map may open at its own viewport, or keep the one on screen
+        zoom = min(zoom, map_entry['zoom_start'])
+        bounds = viewport.union_bounds(bounds, viewport.initial_bounds(map_entry['center'], map_entry['zoom_start']))
+
+    level = geometry.select_level(pyramid, zoom)
+    if sent is None or sent.map_key != map_key or sent.level != level:
+        sent = viewport.SentRegions(map_key, level, len(region_index))
+        st.session_state["atlas_viewport"] = sent
+
+    shown = np.zeros(len(region_index), dtype=bool)
+    shown[map_data.index] = True
+    rows = viewport.visible_rows(region_index, viewport.expand_bounds(bounds), shown, zoom)
+    new_rows = sent.take_new(rows)
+    if len(new_rows) == 0:
+        return None, 0, sent
+
+    group, payload_bytes = viewport.region_delta(
+        map_entry['map'], map_entry['viewport'], pyramid[level], new_rows, sent.key, pipeline.TOOLTIP_STYLE
     )
+    return group, payload_bytes, sent
+
+@st.fragment
+@profiler.fragment("map")
+def map_section(view, map_data):
+    """Map, legend and display toggles; changing a display option reruns only this section."""
+    analysis_mode = view['analysis_mode']
+    map_col, map_unit = view['map_col'], view['map_unit']
+    selected_category, selected_product_label = view['category'], view['product_label']
     
-    # Add province boundaries (if enabled)
-    if show_boundaries and 'Province' in map_data.columns:
-        province_boundaries = map_data.dissolve(by='Province', as_index=False)
-        
-        folium.GeoJson(
-            province_boundaries,
-            name="Province Boundaries",
-            style_function=lambda x: {
-                'fillColor': 'transparent',
-                'color': '#ffffff',
-                'weight': 2,
-                'fillOpacity': 0,
-                'opacity': 0.6
-            },
-            tooltip=folium.GeoJsonTooltip(
-                fields=['Province'],
-                aliases=['Province:'],
-                localize=True
-            )
-        ).add_to(m)
+    # Display options
+    opt_col1, opt_col2, opt_col3 = st.columns(3)
+    with opt_col1:
+        show_values = st.toggle("Show values on hover", value=True)
+    with opt_col2:
+        show_boundaries = st.toggle("Show province boundaries", value=True)
+    with opt_col3:
+        tile_mode = st.toggle(
+            "Vector tile mode",
+            value=False,
+            help="Stream region geometry as cached vector tiles instead of embedding it in the page"
+        )
     
-    if analysis_mode == "Top Product per Region":
-        # CATEGORICAL COLOR MAP
-        unique_products = map_data[col_name].dropna().unique()
-        
-        if len(unique_products) <= 10:
-            colors = [
-                '#9e0142', '#d53e4f', '#f46d43', '#fdae61', '#fee08b',
-                '#e6f598', '#abdda4', '#66c2a5', '#3288bd', '#5e4fa2'
-            ]
+    col_map, col_legend = st.columns([3, 1])
+
+    # Map Column
+    with col_map:
+        st.subheader("Interactive Map")
+
+        # Reuse the built map when this exact view was drawn recently
+        map_cache = load_render_cache()
+        map_key = pipeline.map_cache_key(view, show_values, show_boundaries, tile_mode)
+        map_entry = map_cache.get(map_key)
+
+        if map_entry is None:
+            # Vector tile mode needs the optional package and a running endpoint
+            if tile_mode:
+                import tiles
+
+                if not tiles.available():
+                    st.warning("Vector tile mode needs the `mapbox-vector-tile` package; showing the standard map.")
+                    tile_mode = False
+                else:
+                    try:
+                        start_tile_service()
+                    except OSError as e:
+                        st.warning(f"Could not start the tile server ({e}); showing the standard map.")
+                        tile_mode = False
+
+            with profiler.section("map_build"):
+                m, map_entry = pipeline.build_map(
+                    view,
+                    map_data,
+                    load_geometry_pyramid(),
+                    province_boundaries=load_province_boundaries() if show_boundaries else None,
+                    show_values=show_values,
+                    tile_mode=tile_mode,
+                    viewport_culling=viewport.culling_enabled(len(map_data), tile_mode),
+                    regions=load_region_table(),
+                )
+                cache_map(map_cache, map_key, m, map_entry)
+
+        # Large selections send only the regions newly in view
+        culling = 'viewport' in map_entry
+        region_group, delta_bytes = None, 0
+        if culling:
+            with profiler.section("viewport"):
+                region_group, delta_bytes, sent = viewport_delta(map_key, map_entry, map_data)
+
+        with profiler.section("st_folium"), map_entry['lock'], viewport.restored(map_entry['map']):
+            from streamlit_folium import st_folium
+
+            map_state = st_folium(
+                map_entry['map'],
+                key="atlas_map",
+                height=600,
+                use_container_width=True,
+                feature_group_to_add=region_group,
+                returned_objects=["last_clicked", "bounds", "zoom"] if culling else ["last_clicked"]
+            )
+        product_colors = map_entry['product_colors']
+
+        cache_stats = map_cache.stats()
+        if culling:
+            payload_note = (
+                f"Map payload: {map_payload.format_size(map_entry['payload_bytes'] + delta_bytes)} this update • "
+                f"{len(sent)} of {map_entry['features']} features sent for the viewport"
+            )
         else:
-            import matplotlib.cm as cm_mpl
-            import matplotlib.colors as mcolors
-            cmap = cm_mpl.get_cmap('tab20', len(unique_products))
-            colors = [mcolors.rgb2hex(cmap(i)) for i in range(len(unique_products))]
-        
-        product_colors = dict(zip(unique_products, colors[:len(unique_products)]))
-        
-        def style_function(feature):
-            product = feature['properties'].get(col_name)
-            color = product_colors.get(product, '#888888')
-            return {
-                'fillColor': color,
-                'fillOpacity': 0.6,
-                'color': color,
-                'weight': 1.5,
-                'opacity': 0.9
-            }
-        
-        def highlight_function(feature):
-            product = feature['properties'].get(col_name)
-            color = product_colors.get(product, '#888888')
-            return {
-                'fillColor': color,
-                'fillOpacity': 0.85,
-                'weight': 3,
-                'color': '#ffffff',
-                'opacity': 1
-            }
-        
-        tooltip_fields = ["shapeName", col_name, col_value]
-        tooltip_aliases = ["Region:", "Product:", f"Value ({unit}):"]
-        
-        if "Province" in map_data.columns:
-            tooltip_fields.insert(1, "Province")
-            tooltip_aliases.insert(1, "Province:")
-    
-    else:
-        # CONTINUOUS COLOR SCALE
-        vmin = map_data[value_col].min()
-        vmax = map_data[value_col].max()
-        
-        # Category-specific color scales
-        continuous_color_scales = {
-            "🌾 Field Crops": ['#ffffe5', '#fff7bc', '#fee391', '#fec44f', '#fe9929', '#ec7014', '#cc4c02', '#993404', '#662506'],
-            "🥬 Vegetables": ['#f7fcf5', '#e5f5e0', '#c7e9c0', '#a1d99b', '#74c476', '#41ab5d', '#238b45', '#006d2c', '#00441b'],
-            "🍓 Fruits & Berries": ['#fff5f0', '#fee0d2', '#fcbba1', '#fc9272', '#fb6a4a', '#ef3b2c', '#cb181d', '#a50f15', '#67000d'],
-            "🏡 Greenhouse Products": ['#fcfbfd', '#efedf5', '#dadaeb', '#bcbddc', '#9e9ac8', '#807dba', '#6a51a3', '#54278f', '#3f007d'],
-            "🐄 Livestock": ['#ffffe5', '#fff7bc', '#fee391', '#fec44f', '#fe9929', '#ec7014', '#cc4c02', '#993404', '#662506'],
-            "🐔 Poultry": ['#fff5eb', '#fee6ce', '#fdd0a2', '#fdae6b', '#fd8d3c', '#f16913', '#d94801', '#a63603', '#7f2704'],
-        }
-        
-        colors = continuous_color_scales.get(selected_category, ['#ffffe5', '#fff7bc', '#fee391', '#fec44f', '#fe9929', '#ec7014', '#cc4c02', '#993404', '#662506'])
-        
-        colormap = cm.LinearColormap(
-            colors=colors,
-            vmin=vmin,
-            vmax=vmax
+            payload_note = f"Map payload: {map_payload.format_size(map_entry['payload_bytes'])} • {map_entry['features']} features"
+        st.caption(
+            f"{payload_note} • render cache {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+            f"(~{map_payload.format_size(cache_stats['bytes'])} estimated)"
         )
-        
-        def style_function(feature):
-            value = feature['properties'].get(value_col, 0)
-            return {
-                'fillColor': colormap(value) if value > 0 else '#cccccc',
-                'fillOpacity': 0.7,
-                'color': '#666666',
-                'weight': 1,
-                'opacity': 0.8
-            }
-        
-        def highlight_function(feature):
-            return {
-                'fillOpacity': 0.9,
-                'weight': 3,
-                'color': '#ffffff'
-            }
-        
-        tooltip_fields = ["shapeName", value_col]
-        tooltip_aliases = ["Region:", f"{selected_product_label} ({unit}):"]
-        
-        if "Province" in map_data.columns:
-            tooltip_fields.insert(1, "Province")
-            tooltip_aliases.insert(1, "Province:")
-    
-    # Add GeoJson layer
-    folium.GeoJson(
-        map_data,
-        name="Agricultural Products",
-        style_function=style_function,
-        highlight_function=highlight_function,
-        tooltip=folium.GeoJsonTooltip(
-            fields=tooltip_fields,
-            aliases=tooltip_aliases,
-            localize=True,
-            sticky=False,
-            labels=True,
-            style="""
-                background-color: rgba(255, 255, 255, 0.95);
-                color: #333;
-                border: 2px solid #333;
-                border-radius: 5px;
-                padding: 8px;
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                box-shadow: 0 2px 6px rgba(0,0,0,0.3);
-            """,
-        ) if show_values else None
-    ).add_to(m)
-    
-    folium.LayerControl().add_to(m)
-    st_folium(m, width=None, height=600, returned_objects=[])
 
-# ====================================================================
-# Legend Column
-# ====================================================================
-with col_legend:
-    if analysis_mode == "Top Product per Region":
-        st.subheader("Legend")
-        
-        for product, color in product_colors.items():
-            col1, col2 = st.columns([1, 5])
-            with col1:
-                st.markdown(
-                    f'<div style="width: 20px; height: 20px; background-color: {color}; '
-                    f'border: 1px solid #333; border-radius: 3px;"></div>',
-                    unsafe_allow_html=True
+    # Legend Column
+    with col_legend, profiler.section("legend"):
+        if analysis_mode == "Top Product per Region":
+            st.subheader("Legend")
+
+            for product, color in product_colors.items():
+                col1, col2 = st.columns([1, 5])
+                with col1:
+                    st.markdown(
+                        f'<div style="width: 20px; height: 20px; background-color: {color}; '
+                        f'border: 1px solid #333; border-radius: 3px;"></div>',
+                        unsafe_allow_html=True
+                    )
+                with col2:
+                    st.markdown(f"**{product}**")
+
+            st.caption(f"{len(product_colors)} unique products")
+
+        else:
+            st.subheader("Color Scale")
+            st.markdown(f"**{selected_product_label}**")
+            value_format = ",.2f" if view['density'] else ",.0f"
+            st.markdown(f"Range: {map_data[map_col].min():{value_format}} - {map_data[map_col].max():{value_format}} {map_unit}")
+
+            # Get the color scale for this category
+            colors = pipeline.color_scale(selected_category)
+            gradient_str = ', '.join(colors)
+
+            st.markdown(f"""
+            <div style="background: linear-gradient(to right, {gradient_str}); 
+                        height: 30px; border-radius: 5px; border: 1px solid #333; margin: 10px 0;"></div>
+            <div style="display: flex; justify-content: space-between; font-size: 11px;">
+                <span>Low</span>
+                <span>Medium</span>
+                <span>High</span>
+            </div>
+            """, unsafe_allow_html=True)
+
+            st.caption(f"{len(map_data)} regions")
+
+    # Region inspector: a click only reruns this section and reuses the cached map
+    with col_legend, profiler.section("inspect"):
+        st.markdown("---")
+        st.subheader("Region Details")
+        unit = view['unit']
+
+        clicked = (map_state or {}).get("last_clicked")
+        position = load_region_index().locate(clicked["lng"], clicked["lat"]) if clicked else None
+
+        if position is None or position not in map_data.index:
+            st.caption("Click a region on the map to see its full product breakdown.")
+        else:
+            region = map_data.loc[position]
+            st.markdown(f"**{region['shapeName']}**")
+            if 'Province' in map_data.columns:
+                st.caption(region['Province'])
+
+            breakdown = pipeline.region_breakdown(load_product_matrix(), position, selected_category)
+            if breakdown.empty:
+                st.caption(f"No {selected_category} production recorded.")
+            else:
+                if breakdown['Category'].nunique() == 1:
+                    breakdown = breakdown.drop(columns='Category')
+                st.dataframe(
+                    breakdown,
+                    hide_index=True,
+                    use_container_width=True,
+                    height=min(400, 38 + 35 * len(breakdown)),
+                    column_config={'Value': st.column_config.NumberColumn(f"Value ({unit})", format="%.0f")}
                 )
-            with col2:
-                st.markdown(f"**{product}**")
-        
-        st.caption(f"{len(product_colors)} unique products")
-    
-    else:
-        st.subheader("Color Scale")
-        st.markdown(f"**{selected_product_label}**")
-        st.markdown(f"Range: {map_data[value_col].min():,.0f} - {map_data[value_col].max():,.0f} {unit}")
-        
-        # Get the color scale for this category
-        continuous_color_scales = {
-            "🌾 Field Crops": ['#ffffe5', '#fff7bc', '#fee391', '#fec44f', '#fe9929', '#ec7014', '#cc4c02', '#993404', '#662506'],
-            "🥬 Vegetables": ['#f7fcf5', '#e5f5e0', '#c7e9c0', '#a1d99b', '#74c476', '#41ab5d', '#238b45', '#006d2c', '#00441b'],
-            "🍓 Fruits & Berries": ['#fff5f0', '#fee0d2', '#fcbba1', '#fc9272', '#fb6a4a', '#ef3b2c', '#cb181d', '#a50f15', '#67000d'],
-            "🏡 Greenhouse Products": ['#fcfbfd', '#efedf5', '#dadaeb', '#bcbddc', '#9e9ac8', '#807dba', '#6a51a3', '#54278f', '#3f007d'],
-            "🐄 Livestock": ['#ffffe5', '#fff7bc', '#fee391', '#fec44f', '#fe9929', '#ec7014', '#cc4c02', '#993404', '#662506'],
-            "🐔 Poultry": ['#fff5eb', '#fee6ce', '#fdd0a2', '#fdae6b', '#fd8d3c', '#f16913', '#d94801', '#a63603', '#7f2704'],
-        }
-        
-        colors = continuous_color_scales.get(selected_category, ['#ffffe5', '#fff7bc', '#fee391', '#fec44f', '#fe9929', '#ec7014', '#cc4c02', '#993404', '#662506'])
-        gradient_str = ', '.join(colors)
-        
-        st.markdown(f"""
-        <div style="background: linear-gradient(to right, {gradient_str}); 
-                    height: 30px; border-radius: 5px; border: 1px solid #333; margin: 10px 0;"></div>
-        <div style="display: flex; justify-content: space-between; font-size: 11px;">
-            <span>Low</span>
-            <span>Medium</span>
-            <span>High</span>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        st.caption(f"{len(map_data)} regions")
+                st.caption(f"{len(breakdown)} products • {breakdown['Value'].sum():,.0f} {unit} in total")
+
 
 # ====================================================================
 # Additional Visualizations
 # ====================================================================
-st.markdown("---")
-st.subheader("Production Analysis")
+@st.fragment
+@profiler.fragment("charts")
+def charts_section(view, row_positions, top_product_stats, province_totals):
+    """Bar and bubble charts built from the precomputed aggregates."""
+    viz_col1, viz_col2 = st.columns(2)
 
-viz_col1, viz_col2 = st.columns(2)
+    with viz_col1, profiler.section("bar"):
+        # Bar chart
+        fig_bar = pipeline.bar_chart(view, load_data(), load_product_matrix(), row_positions, top_product_stats)
+        st.plotly_chart(fig_bar, use_container_width=True)
 
-with viz_col1:
-    # Bar chart
-    if analysis_mode == "Top Product per Region":
-        product_summary = map_data.groupby(col_name)[col_value].sum().sort_values(ascending=False).head(10)
-        chart_title = f"Top 10 Products by Total Value ({unit})"
-    else:
-        product_summary = map_data.nlargest(10, value_col)[[value_col, 'shapeName']].set_index('shapeName')[value_col]
-        chart_title = f"Top 10 Regions - {selected_product_label} ({unit})"
-    
-    fig_bar = px.bar(
-        x=product_summary.values,
-        y=product_summary.index,
-        orientation='h',
-        labels={'x': f'Total Value ({unit})', 'y': 'Region' if analysis_mode != "Top Product per Region" else 'Product'},
-        title=chart_title,
-        color=product_summary.values,
-        color_continuous_scale=category_info["color"]
-    )
-    fig_bar.update_layout(
-        showlegend=False,
-        height=450,
-        yaxis={'categoryorder': 'total ascending'}
-    )
-    st.plotly_chart(fig_bar, use_container_width=True)
-
-#### Bubble 
-with viz_col2:
-    # Bubble Chart - Province Statistics
-    
-    # Calculate statistics per province
-    province_stats = map_data.groupby('Province').agg({
-        value_col: ['sum', 'mean', 'count']
-    }).reset_index()
-    province_stats.columns = ['Province', 'Total_Production', 'Avg_Per_Region', 'Num_Regions']
-    
-    # Sort by total production and get top 10
-    province_stats = province_stats.nlargest(10, 'Total_Production')
-    
-    fig_bubble = px.scatter(
-        province_stats,
-        x='Num_Regions',
-        y='Total_Production',
-        size='Avg_Per_Region',
-        color='Province',
-        hover_name='Province',
-        hover_data={
-            'Num_Regions': ':,',
-            'Total_Production': ':,.0f',
-            'Avg_Per_Region': ':,.0f',
-            'Province': False
-        },
-        labels={
-            'Num_Regions': 'Number of Producing Regions',
-            'Total_Production': f'Total Production ({unit})',
-            'Avg_Per_Region': f'Avg per Region ({unit})'
-        },
-        title=f"Provincial Overview: Scale vs Intensity",
-        size_max=60
-    )
-    
-    fig_bubble.update_layout(
-        showlegend=True,
-        height=450,
-        legend=dict(
-            orientation="v",
-            yanchor="top",
-            y=1,
-            xanchor="left",
-            x=1.02,
-            font=dict(size=9)
-        ),
-        xaxis=dict(gridcolor='lightgray'),
-        yaxis=dict(gridcolor='lightgray')
-    )
-    
-    st.plotly_chart(fig_bubble, use_container_width=True)
-    st.caption("💡 **Bubble size** = Average production per region | **X-axis** = Number of regions | **Y-axis** = Total production")
+    #### Bubble 
+    with viz_col2, profiler.section("bubble"):
+        # Bubble Chart - Province Statistics
+        fig_bubble = pipeline.bubble_chart(view, province_totals)
+        st.plotly_chart(fig_bubble, use_container_width=True)
+        st.caption("💡 **Bubble size** = Average production per region | **X-axis** = Number of regions | **Y-axis** = Total production")
 
 # ====================================================================
 # Sankey Diagram - Full Width
 # ====================================================================
-if 'Province' in map_data.columns and len(map_data) > 5:
-    st.markdown("---")
-    
-    if analysis_mode == "Top Product per Region":
-        # Get top province-product combinations
-        sankey_data = map_data.groupby(['Province', col_name])[col_value].sum().reset_index()
-        sankey_data = sankey_data.nlargest(25, col_value)  # Increased to 25 for more detail
-        
-        # Create source and target lists
-        provinces = sankey_data['Province'].unique().tolist()
-        products = sankey_data[col_name].unique().tolist()
-        
-        # Create node labels (provinces first, then products)
-        labels = provinces + products
-        
-        # Create source, target, and value lists
-        source = [provinces.index(p) for p in sankey_data['Province']]
-        target = [len(provinces) + products.index(p) for p in sankey_data[col_name]]
-        values = sankey_data[col_value].tolist()
-        
-        # Color nodes by type
-        node_colors = ['#3498db'] * len(provinces) + ['#e74c3c'] * len(products)
-        
-        fig_sankey = {
-            'data': [{
-                'type': 'sankey',
-                'node': {
-                    'pad': 20,
-                    'thickness': 25,
-                    'line': {'color': 'white', 'width': 1},
-                    'label': labels,
-                    'color': node_colors,
-                    'customdata': [f'{unit}' for _ in labels],
-                    'hovertemplate': '%{label}<br>%{value:,.0f} ' + unit + '<extra></extra>'
-                },
-                'link': {
-                    'source': source,
-                    'target': target,
-                    'value': values,
-                    'color': 'rgba(255,255,255,0.3)',  # White with transparency
-                    'hovertemplate': '%{source.label} → %{target.label}<br>%{value:,.0f} ' + unit + '<extra></extra>'
-                }
-            }],
-            'layout': {
-                'title': {
-                    'text': f'Province to Product Flow (Top 25 Combinations)',
-                    'font': {'size': 18}
-                },
-                'height': 600,
-                'font': {'size': 11},
-                'plot_bgcolor': 'rgba(0,0,0,0)',
-                'paper_bgcolor': 'rgba(0,0,0,0)'
-            }
-        }
-        
-        st.plotly_chart(fig_sankey, use_container_width=True)
-        
-        st.caption("💡 **How to read:** Flow thickness represents production volume. Blue nodes are provinces, red nodes are products. Hover for details.")
-        
-    else:
-        # For specific product, show province -> region sankey
-        sankey_data = map_data.nlargest(25, value_col)[['Province', 'shapeName', value_col]].copy()
-        
-        provinces = sankey_data['Province'].unique().tolist()
-        regions = sankey_data['shapeName'].unique().tolist()
-        
-        labels = provinces + regions
-        
-        source = [provinces.index(p) for p in sankey_data['Province']]
-        target = [len(provinces) + regions.index(r) for r in sankey_data['shapeName']]
-        values = sankey_data[value_col].tolist()
-        
-        node_colors = ['#3498db'] * len(provinces) + ['#2ecc71'] * len(regions)
-        
-        fig_sankey = {
-            'data': [{
-                'type': 'sankey',
-                'node': {
-                    'pad': 20,
-                    'thickness': 25,
-                    'line': {'color': 'white', 'width': 1},
-                    'label': labels,
-                    'color': node_colors,
-                    'hovertemplate': '%{label}<br>%{value:,.0f} ' + unit + '<extra></extra>'
-                },
-                'link': {
-                    'source': source,
-                    'target': target,
-                    'value': values,
-                    'color': 'rgba(255,255,255,0.3)',  # White with transparency
-                    'hovertemplate': '%{source.label} → %{target.label}<br>%{value:,.0f} ' + unit + '<extra></extra>'
-                }
-            }],
-            'layout': {
-                'title': {
-                    'text': f'{selected_product_label} Production: Province to Region Flow (Top 25)',
-                    'font': {'size': 18}
-                },
-                'height': 600,
-                'font': {'size': 11},
-                'plot_bgcolor': 'rgba(0,0,0,0)',
-                'paper_bgcolor': 'rgba(0,0,0,0)'
-            }
-        }
-        
-        st.plotly_chart(fig_sankey, use_container_width=True)
-        
-        st.caption("💡 **How to read:** Flow thickness represents production volume. Blue nodes are provinces, green nodes are regions. Hover for details.")
+@st.fragment
+@profiler.fragment("sankey")
+def sankey_section(view, map_data, top_product_stats):
+    """Province to product (or region) flow diagram."""
+    if 'Province' in map_data.columns and len(map_data) > 5:
+        st.markdown("---")
+        top_mode = view['analysis_mode'] == "Top Product per Region"
+
+        flow_col1, flow_col2 = st.columns(2)
+        with flow_col1:
+            max_links = st.select_slider(
+                "Flows per level",
+                options=[10, 25, 50, 100, 250, 500, 1000, 2500],
+                value=pipeline.SANKEY_MAX_LINKS,
+                help="Smaller flows are grouped into grey \"Other\" nodes"
+            )
+        with flow_col2:
+            by_division = top_mode and st.toggle(
+                "Show census divisions",
+                value=False,
+                help="Route each province's flows through its census divisions"
+            )
+
+        with profiler.section("sankey"):
+            fig_sankey = pipeline.sankey_chart(view, map_data, top_product_stats, max_links, by_division)
+            st.plotly_chart(fig_sankey, use_container_width=True)
+
+        if by_division:
+            st.caption("💡 **How to read:** Flow thickness represents production volume. Blue nodes are provinces, purple nodes are census divisions, red nodes are each division's top product. Hover for details.")
+        elif top_mode:
+            st.caption("💡 **How to read:** Flow thickness represents production volume. Blue nodes are provinces, red nodes are products. Hover for details.")
+        else:
+            st.caption("💡 **How to read:** Flow thickness represents production volume. Blue nodes are provinces, green nodes are regions. Hover for details.")
+
 
 # ====================================================================
 # Province Comparison
 # ====================================================================
-if 'Province' in map_data.columns and (len(selected_provinces) > 1 or "All Canada" in selected_provinces):
-    st.markdown("---")
-    st.subheader("Provincial Comparison")
-    
-    province_summary = map_data.groupby('Province').agg({
-        value_col: 'sum',
-        'ADM2_KEY': 'count'
-    }).rename(columns={
-        value_col: 'Total Production',
-        'ADM2_KEY': 'Number of Regions'
-    }).sort_values('Total Production', ascending=False)
-    
-    province_color_map = {
-        'Ontario': '#1f77b4',
-        'Quebec / Québec': '#3498db',
-        'British Columbia / Colombie-Britannique': '#2ecc71',
-        'Alberta': '#e74c3c',
-        'Manitoba': '#f39c12',
-        'Saskatchewan': '#f1c40f',
-        'Nova Scotia / Nouvelle-Écosse': '#9b59b6',
-        'New Brunswick / Nouveau-Brunswick': '#e67e22',
-        'Newfoundland and Labrador / Terre-Neuve-et-Labrador': '#16a085',
-        'Prince Edward Island / Île-du-Prince-Édouard': '#e91e63',
-        'Northwest Territories / Territoires du Nord-Ouest': '#34495e',
-        'Nunavut': '#95a5a6',
-        'Yukon': '#d35400',
-    }
+@st.fragment
+@profiler.fragment("province_comparison")
+def province_comparison_section(view, map_data, province_totals):
+    """Top provinces by total production."""
+    selected_provinces = view['provinces']
     
-    fig_province = px.bar(
-        province_summary.head(10),
-        y=province_summary.head(10).index,
-        x='Total Production',
-        orientation='h',
-        title=f"Top 10 Provinces by Total Production ({unit})",
-        labels={'y': 'Province', 'Total Production': f'Total Value ({unit})'},
-        text='Total Production',
-        color=province_summary.head(10).index,
-        color_discrete_map=province_color_map
-    )
-    fig_province.update_traces(texttemplate='%{text:.2s}', textposition='outside')
-    fig_province.update_layout(
-        height=500,
-        yaxis={'categoryorder': 'total ascending'},
-        showlegend=False
-    )
-    st.plotly_chart(fig_province, use_container_width=True)
+    if 'Province' in map_data.columns and (len(selected_provinces) > 1 or "All Canada" in selected_provinces):
+        st.markdown("---")
+        st.subheader("Provincial Comparison")
+
+        with profiler.section("province_comparison"):
+            fig_province = pipeline.province_chart(view, province_totals, load_region_table())
+            st.plotly_chart(fig_province, use_container_width=True)
+
 
 # ====================================================================
 # Data Table
 # ====================================================================
-with st.expander("📋 View Full Data Table"):
-    if analysis_mode == "Top Product per Region":
-        display_columns = ["shapeName", "Province", col_name, col_value]
-    else:
-        display_columns = ["shapeName", "Province", value_col]
+@st.fragment
+@profiler.fragment("table")
+def table_section(view, map_data, province_positions):
+    """Data table and exports; toggling the table or changing export options reruns only this section."""
+    with profiler.section("table"):
+        analysis_mode = view['analysis_mode']
+        col_name, col_value, value_col = view['col_name'], view['col_value'], view['value_col']
+        selected_category, selected_product_label = view['category'], view['product_label']
+        selected_provinces = view['provinces']
     
-    display_columns = [c for c in display_columns if c in map_data.columns]
-    table_data = map_data[display_columns].sort_values(display_columns[-1], ascending=False).reset_index(drop=True)
+        if analysis_mode == "Top Product per Region":
+            display_columns = ["shapeName", "Province", col_name, col_value]
+        else:
+            display_columns = ["shapeName", "Province", view['map_col']]
+            if view['density']:
+                display_columns.insert(2, value_col)
+        display_columns = [c for c in display_columns if c in map_data.columns]
     
-    st.dataframe(table_data, use_container_width=True, height=400)
+        show_table = st.toggle("📋 View Full Data Table", value=False)
     
-    csv = table_data.to_csv(index=False)
-    region_suffix = "_".join([p.lower().replace(" ", "_") for p in selected_provinces]) if "All Canada" not in selected_provinces else "canada"
-    filename = f"{region_suffix}_{selected_product_label.lower().replace(' ', '_')}.csv" if analysis_mode != "Top Product per Region" else f"{region_suffix}_{selected_category.lower().replace(' ', '_')}.csv"
+        if show_table:
+            table_data = map_data[display_columns].sort_values(display_columns[-1], ascending=False).reset_index(drop=True)
+            st.dataframe(table_data, use_container_width=True, height=400)
     
-    st.download_button(
-        label="📥 Download Data as CSV",
-        data=csv,
-        file_name=filename,
-        mime="text/csv"
-    )
+        # Exports are generated only when a download button is clicked
+        region_suffix = "_".join([p.lower().replace(" ", "_") for p in selected_provinces]) if "All Canada" not in selected_provinces else "canada"
+        file_stem = f"{region_suffix}_{selected_product_label.lower().replace(' ', '_')}" if analysis_mode != "Top Product per Region" else f"{region_suffix}_{selected_category.lower().replace(' ', '_')}"
+    
+        exp_col1, exp_col2 = st.columns(2)
+        with exp_col1:
+            export_format = st.radio("Export format", list(export.EXPORT_FORMATS), horizontal=True)
+        with exp_col2:
+            export_scope = st.radio(
+                "Export columns",
+                ["Current view", "All products"],
+                horizontal=True,
+                help="All products exports every product column for the selected provinces"
+            )
+    
+        with_geometry = export_format == "GeoJSON"
+        if export_scope == "Current view":
+            def export_data():
+                columns = display_columns + ([map_data.geometry.name] if with_geometry else [])
+                frame = map_data[columns].sort_values(display_columns[-1], ascending=False)
+                return export.build_export(frame, export_format)
+            file_name = export.export_filename(file_stem, export_format)
+        else:
+            def export_data():
+                frame = export.all_products_frame(load_product_matrix(), province_positions, include_geometry=with_geometry)
+                return export.build_export(frame, export_format)
+            file_name = export.export_filename(f"{region_suffix}_all_products", export_format)
+    
+        st.download_button(
+            label=f"📥 Download Data as {export_format}",
+            data=export_data,
+            file_name=file_name,
+            mime=export.EXPORT_FORMATS[export_format][1],
+            on_click="ignore"
+        )
+
+
+# ====================================================================
+# Page Sections
+# ====================================================================
+map_section(view, map_data)
+
+st.markdown("---")
+st.subheader("Production Analysis")
+charts_section(view, row_positions, top_product_stats, province_totals)
+sankey_section(view, map_data, top_product_stats)
+province_comparison_section(view, map_data, province_totals)
+table_section(view, map_data, province_positions)
 
 # ====================================================================
 # Footer
@@ -1019,4 +872,29 @@ st.sidebar.markdown("""
 """)
 
 st.sidebar.markdown("---")
-st.sidebar.caption("🍁 Powered by Streamlit | Data: Statistics Canada")
\ No newline at end of file
+st.sidebar.caption("🍁 Powered by Streamlit | Data: Statistics Canada")
+
+# ====================================================================
+# Profiling Panel
+# ====================================================================
+if profiler.enabled:
+    profiler.finish(
+        category=selected_category,
+        mode=analysis_mode,
+        product=selected_product,
+        group=selected_group,
+        top_k=top_k,
+        provinces=selected_provinces,
+        regions=len(map_data),
+    )
+    with st.sidebar.expander("⏱️ Profiling", expanded=True):
+        timings = pd.DataFrame(profiler.rows(), columns=["Section", "ms"])
+        st.dataframe(timings, hide_index=True, use_container_width=True)
+        st.caption(f"Rerun total: {profiler.total() * 1000:,.0f} ms • logged to `{profiler.log_path}`")
+        footprint = adm2_data.attrs.get("footprint")
+        if footprint:
+            st.caption(
+                f"Region frame (key columns + geometry): {map_payload.format_size(footprint['before'])} → "
+                f"{map_payload.format_size(footprint['after'])} • product matrix: "
+                f"{map_payload.format_size(matrix.values.nbytes)}"
+            )
\ No newline at end of file
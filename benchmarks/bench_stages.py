@@ -0,0 +1,241 @@
+"""
+Stage-level benchmarks for the atlas pipeline.
+
+Runs each pipeline stage headless (no Streamlit) over synthetic datasets
+(see ``synthetic_data``) of several sizes and reports the best-of-N wall
+time and the peak traced memory per stage. Results can be saved as a baseline and later
+runs compared against it; any stage slower or larger than the baseline
+beyond the tolerance fails the run with a non-zero exit code.
+
+    python -m benchmarks.bench_stages --sizes 300 2000 10000
+    python -m benchmarks.bench_stages --save-baseline
+    python -m benchmarks.bench_stages --baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from catalog import CATEGORIES, category_codes
+
+import aggregates
+import data_store
+import geometry
+import map_payload
+import pipeline
+import product_matrix
+import region_table
+import synthetic_data
+import topology
+
+DEFAULT_SIZES = [300, 2000, 10000]
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+
+BENCH_CATEGORY = "🌾 Field Crops"
+BENCH_PROVINCES = ["Alberta", "Saskatchewan"]
+
+# Differences smaller than these are treated as noise when comparing
+MIN_SECONDS_DELTA = 0.002
+MIN_PEAK_MB_DELTA = 0.5
+
+
+# ====================================================================
+# Stages
+# ====================================================================
+def build_stages(source, cache_dir):
+    """
+    Return ``[(name, fn)]`` in pipeline order.
+
+    Each stage reads the previous stages' outputs from a shared state dict,
+    so stages must run in order; every call recomputes from scratch.
+    """
+    state = {}
+    codes = category_codes(BENCH_CATEGORY)
+    col_name, col_value = CATEGORIES[BENCH_CATEGORY]["columns"]
+
+    def load():
+        state['adm2'] = data_store.load_columns([], source, cache_dir)
+        state['frame'] = data_store.load_columns(product_matrix.matrix_columns(), source, cache_dir)
+
+    def matrix():
+        state['matrix'] = product_matrix.build_product_matrix(state['frame'])
+
+    def indexes():
+        state['province_index'] = data_store.province_row_index(state['adm2'])
+        state['pyramid'] = geometry.build_geometry_pyramid(state['adm2'].geometry)
+        state['boundaries'] = geometry.build_province_boundaries(state['adm2'])
+
+    def regions():
+        state['regions'] = region_table.RegionTable(state['adm2'].geometry, state['province_index'])
+
+    def aggregate():
+        state['cube'] = aggregates.AggregationCube(state['matrix'], state['province_index'])
+
+    def filter_rows():
+        state['view'] = pipeline.make_view(BENCH_CATEGORY, provinces=BENCH_PROVINCES)
+        state['rows'] = pipeline.filter_rows(state['province_index'], len(state['adm2']), BENCH_PROVINCES)
+
+    def top_rank():
+        state['matrix']._top_k_cache.clear()
+        state['map_data'], state['top_rows'], _ = pipeline.top_product_view(
+            state['adm2'], state['matrix'], state['rows'], codes, col_name, col_value
+        )
+
+    def style():
+        state['layer_data'] = geometry.with_level_geometry(
+            state['map_data'], state['pyramid'], geometry.select_level(state['pyramid'], pipeline.CANADA_ZOOM)
+        )
+        state['tooltip_fields'] = pipeline.style_layer(state['view'], state['map_data'], state['layer_data'])[2]
+
+    def geojson():
+        map_payload.build_geojson_payload(state['layer_data'], state['tooltip_fields'])
+
+    def topojson():
+        topology.encode(
+            state['layer_data'],
+            [*state['tooltip_fields'], map_payload.FILL_COLOR_COLUMN],
+            topology.quantization_step(pipeline.CANADA_ZOOM),
+        )
+
+    def map_build():
+        m, _ = pipeline.build_map(state['view'], state['map_data'], state['pyramid'], state['boundaries'], regions=state['regions'])
+        pipeline.render_map(m)
+
+    def charts():
+        state['cube']._top_cache.clear()
+        stats, province_totals = pipeline.chart_inputs(state['view'], state['cube'])
+        state['top_product_stats'] = stats
+        pipeline.bar_chart(state['view'], state['adm2'], state['matrix'], state['top_rows'], stats)
+        pipeline.bubble_chart(state['view'], province_totals)
+        pipeline.province_chart(state['view'], province_totals, state['regions'])
+
+    def sankey():
+        pipeline.sankey_chart(state['view'], state['map_data'], state['top_product_stats'])
+
+    def sankey_deep():
+        pipeline.sankey_chart(state['view'], state['map_data'], state['top_product_stats'], max_links=1000, by_division=True)
+
+    return [
+        ("load", load),
+        ("matrix", matrix),
+        ("indexes", indexes),
+        ("regions", regions),
+        ("aggregate", aggregate),
+        ("filter", filter_rows),
+        ("top_rank", top_rank),
+        ("style", style),
+        ("geojson", geojson),
+        ("topojson", topojson),
+        ("map_build", map_build),
+        ("charts", charts),
+        ("sankey", sankey),
+        ("sankey_deep", sankey_deep),
+    ]
+
+
+def measure(fn, repeat):
+    """Best-of-``repeat`` wall time, then one traced call for peak memory."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "peak_mb": peak / (1024 * 1024)}
+
+
+def run(sizes, repeat=3, seed=0):
+    """Benchmark every stage for each dataset size; returns ``{size: {stage: result}}``."""
+    results = {}
+    for n_regions in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / "adm2.geojson"
+            cache_dir = Path(tmp) / "cache"
+            synthetic_data.generate(n_regions, seed=seed).to_file(source, driver="GeoJSON")
+            data_store.build_cache(source, cache_dir)
+
+            results[str(n_regions)] = {}
+            for name, fn in build_stages(source, cache_dir):
+                results[str(n_regions)][name] = measure(fn, repeat)
+                print(f"  {n_regions:>7} {name:<10} {results[str(n_regions)][name]['seconds'] * 1000:10.1f} ms "
+                      f"{results[str(n_regions)][name]['peak_mb']:9.1f} MB", flush=True)
+    return results
+
+
+# ====================================================================
+# Baseline Comparison
+# ====================================================================
+def compare(results, baseline, tolerance=0.25, memory_tolerance=0.25):
+    """Return a list of regression messages for stages worse than ``baseline``."""
+    regressions = []
+    for size, stages in results.items():
+        for stage, current in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            if base is None:
+                continue
+            slower = current["seconds"] - base["seconds"]
+            if current["seconds"] > base["seconds"] * (1 + tolerance) and slower > MIN_SECONDS_DELTA:
+                regressions.append(
+                    f"{stage} @ {size}: {base['seconds'] * 1000:.1f} ms -> {current['seconds'] * 1000:.1f} ms"
+                )
+            larger = current["peak_mb"] - base["peak_mb"]
+            if current["peak_mb"] > base["peak_mb"] * (1 + memory_tolerance) and larger > MIN_PEAK_MB_DELTA:
+                regressions.append(
+                    f"{stage} @ {size}: peak {base['peak_mb']:.1f} MB -> {current['peak_mb']:.1f} MB"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the atlas pipeline stage by stage.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="dataset sizes (regions)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage (best is kept)")
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="baseline results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write results to the baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional slowdown")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="allowed fractional peak memory growth")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())["results"]
+    regressions = compare(results, baseline, args.tolerance, args.memory_tolerance)
+    if regressions:
+        print("Regressions against baseline:")
+        for message in regressions:
+            print(f"  {message}")
+        return 1
+    print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
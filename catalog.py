@@ -0,0 +1,254 @@
+"""
+Product and category catalog for the agricultural atlas.
+
+Maps product codes to human-readable labels, groups them into
+categories, and records which dataset columns each category uses.
+"""
+# ====================================================================
+# Product Dictionaries
+# ====================================================================
+HA_FIELD_CROPS = {
+    "ALFALFA": "Alfalfa and alfalfa mixtures",
+    "BARLEY": "Barley",
+    "BUCWHT": "Buckwheat",
+    "CANARY": "Canary seed",
+    "CANOLA": "Canola (rapeseed)",
+    "CHICPEA": "Chick peas",
+    "CORNGR": "Corn for grain",
+    "CORNSI": "Corn for silage",
+    "DFPEAS": "Dry field peas",
+    "FABABN": "Faba beans",
+    "FLAXSD": "Flaxseed",
+    "FORAGE": "Forage seed for seed",
+    "GINSENG": "Ginseng",
+    "HEMP": "Hemp",
+    "LENTIL": "Lentils",
+    "MUSTSD": "Mustard seed",
+    "MXDGRN": "Mixed grains",
+    "OATS": "Oats",
+    "ODFBNS": "Other dry beans",
+    "OFIELD": "Other field crops",
+    "OTTAME": "All other tame hay and fodder crops",
+    "POTATS": "Potatoes",
+    "RYEFAL": "Fall rye",
+    "RYESPG": "Spring rye",
+    "SOYBNS": "Soybeans",
+    "SUGARB": "Sugar beets",
+    "SUNFLS": "Sunflowers",
+    "TRITCL": "Triticale",
+    "WHITBN": "Dry white beans",
+    "WHTDUR": "Durum wheat",
+    "WHTSPG": "Spring wheat (excluding durum)",
+    "WHTWIN": "Winter wheat",
+}
+
+HA_VEGETABLES = {
+    "ASPNPRD": "Asparagus non-producing",
+    "ASPPROD": "Asparagus producing",
+    "BEANS": "Beans",
+    "BEETS": "Beets",
+    "BROCLI": "Broccoli",
+    "BRSPRT": "Brussels sprouts",
+    "CABAGE": "Cabbage",
+    "CARROT": "Carrots",
+    "CELERY": "Celery",
+    "CHINCABG": "Chinese cabbage",
+    "CLFLWR": "Cauliflower",
+    "CUCUMB": "Cucumbers",
+    "GARLIC": "Garlic",
+    "GRPEAS": "Green peas",
+    "KALE": "Kale",
+    "LETUCE": "Lettuce",
+    "ONIONS": "Onions",
+    "PEPPER": "Peppers",
+    "PUMPKIN": "Pumpkins",
+    "RADISH": "Radishes",
+    "RHUBARB": "Rhubarb",
+    "RTBAGA": "Rutabagas",
+    "SHALOT": "Shallots",
+    "SPNACH": "Spinach",
+    "SQUAZUC": "Squash and zucchini",
+    "SWCORN": "Sweet corn",
+    "TOMATO": "Tomatoes",
+}
+
+HA_FRUITS_BERRIES = {
+    "APCTTA": "Apricots",
+    "APPLETA": "Apples",
+    "BLUEBTA": "Blueberries",
+    "CRANBTA": "Cranberries",
+    "CURRANT": "Blackcurrants, redcurrants and whitecurrants",
+    "GRAPETA": "Grapes",
+    "HASKAPTA": "Haskaps",
+    "HBLUEBTA": "Blueberries, highbush",
+    "LBLUEBTA": "Blueberries, lowbush",
+    "PEARTA": "Pears",
+    "PECHTA": "Peaches",
+    "PLUMTA": "Plums",
+    "RASPBTA": "Raspberries",
+    "SASKBTA": "Saskatoons",
+    "SRCHTA": "Sour cherries",
+    "STRWBTA": "Strawberries",
+    "SWCHTA": "Sweet cherries",
+    "OTFRTTA": "Other fruits, berries and nuts",
+}
+
+GREENHOUSE_PRODUCTS = {
+    "GRNCUCUMB": "Greenhouse cucumbers",
+    "GRNFLOWER": "Cut flowers",
+    "GRNHERB": "Greenhouse herbs",
+    "GRNOTHER": "Other greenhouse products",
+    "GRNOTHVEG": "Other greenhouse fruits and vegetables",
+    "GRNPEPPER": "Greenhouse peppers",
+    "GRNPLANTS": "Potted plants, indoor or outdoor",
+    "GRNTOMATO": "Greenhouse tomatoes",
+}
+
+LIVESTOCK_ANIMALS = {
+    "BFCOWS": "Beef cows",
+    "BFHEIF": "Heifers for beef herd replacement",
+    "BISON": "Bison (buffalo)",
+    "BOARS": "Boars",
+    "BULLS": "Bulls, 1 year and over",
+    "CALFU1": "Calves under 1 year",
+    "DEER": "Deer",
+    "DONKEYS": "Donkeys",
+    "ELK": "Elk",
+    "EWES": "Ewes",
+    "FDHEIF": "Heifers for dairy herd replacement",
+    "GOATS": "Goats",
+    "GRWPIG": "Growing pigs",
+    "HORSES": "Horses",
+    "LAMAS": "Llamas and alpacas",
+    "LAMBS": "Lambs",
+    "MINK": "Mink",
+    "MKTLAMBS": "Market lambs",
+    "MLKCOW": "Milk cows",
+    "MLKHEIF": "Milk heifers",
+    "NRSPIG": "Nursing pigs",
+    "RABBIT": "Rabbits",
+    "RAMS": "Rams",
+    "REPLAMBS": "Replacement lambs",
+    "SOWS": "Sows and gilts for breeding",
+    "STEERS": "Steers, 1 year and over",
+    "WEANPIG": "Weaner pigs",
+}
+
+POULTRY = {
+    "BREEDCHK": "Layer and broiler breeders",
+    "BROILER": "Broilers, roasters and Cornish",
+    "DUCK": "Ducks",
+    "GEESE": "Geese",
+    "HATCHNUM": "Chicks or other poultry hatched",
+    "LAYHEN": "Laying hens, 19 weeks and over",
+    "OTHPLT": "Other poultry",
+    "PULETS": "Pullets under 19 weeks",
+    "TURKEY": "Turkeys",
+}
+
+# Map categories to their product dictionaries
+CATEGORY_PRODUCTS = {
+    "🌾 Field Crops": HA_FIELD_CROPS,
+    "🥬 Vegetables": HA_VEGETABLES,
+    "🍓 Fruits & Berries": HA_FRUITS_BERRIES,
+    "🏡 Greenhouse Products": GREENHOUSE_PRODUCTS,
+    "🐄 Livestock": LIVESTOCK_ANIMALS,
+    "🐔 Poultry": POULTRY,
+}
+
+# ====================================================================
+# Category Configuration
+# ====================================================================
+CATEGORIES = {
+    "🌾 Field Crops": {
+        "columns": ("top_field_crop", "top_field_crop_value"),
+        "color": "YlOrRd",
+        "description": "Major field crops including wheat, canola, barley, and more",
+        "unit": "hectares"
+    },
+    "🥬 Vegetables": {
+        "columns": ("top_vegetable", "top_vegetable_value"),
+        "color": "Greens",
+        "description": "Vegetable production including lettuce, carrots, tomatoes, and more",
+        "unit": "hectares"
+    },
+    "🍓 Fruits & Berries": {
+        "columns": ("top_fruit_berry", "top_fruit_berry_value"),
+        "color": "RdPu",
+        "description": "Fruit and berry production including apples, blueberries, strawberries",
+        "unit": "hectares"
+    },
+    "🏡 Greenhouse Products": {
+        "columns": ("top_greenhouse", "top_greenhouse_value"),
+        "color": "Purples",
+        "description": "Greenhouse production including tomatoes, cucumbers, peppers, flowers",
+        "unit": "hectares"
+    },
+    "🐄 Livestock": {
+        "columns": ("top_livestock", "top_livestock_value"),
+        "color": "YlOrBr",
+        "description": "Livestock including beef cattle, dairy cows, pigs, sheep, and more",
+        "unit": "count"
+    },
+    "🐔 Poultry": {
+        "columns": ("top_poultry", "top_poultry_value"),
+        "color": "Oranges",
+        "description": "Poultry production including chickens, turkeys, ducks, geese",
+        "unit": "count"
+    },
+    "🌱 All Crops": {
+        "columns": ("top_crop", "top_crop_value"),
+        "color": "YlGn",
+        "description": "Overall dominant crop across all categories",
+        "unit": "hectares"
+    },
+    "🐮 All Animals": {
+        "columns": ("top_animal", "top_animal_value"),
+        "color": "BuPu",
+        "description": "Overall dominant animal production (livestock + poultry)",
+        "unit": "count"
+    },
+}
+
+# Aggregate categories are unions of the per-category product dictionaries
+AGGREGATE_CATEGORIES = {
+    "🌱 All Crops": ["🌾 Field Crops", "🥬 Vegetables", "🍓 Fruits & Berries", "🏡 Greenhouse Products"],
+    "🐮 All Animals": ["🐄 Livestock", "🐔 Poultry"],
+}
+
+# Ad-hoc product groupings for top-product rankings
+PRODUCT_GROUPS = {
+    "Cereals": ["BARLEY", "CORNGR", "MXDGRN", "OATS", "RYEFAL", "RYESPG", "TRITCL", "WHTDUR", "WHTSPG", "WHTWIN"],
+    "Wheat": ["WHTDUR", "WHTSPG", "WHTWIN"],
+    "Oilseeds": ["CANOLA", "FLAXSD", "MUSTSD", "SOYBNS", "SUNFLS"],
+    "Pulses": ["CHICPEA", "DFPEAS", "FABABN", "LENTIL", "ODFBNS", "WHITBN"],
+    "Hay & Forage": ["ALFALFA", "CORNSI", "FORAGE", "OTTAME"],
+    "Tree Fruits": ["APCTTA", "APPLETA", "PEARTA", "PECHTA", "PLUMTA", "SRCHTA", "SWCHTA"],
+    "Berries": ["BLUEBTA", "CRANBTA", "CURRANT", "HASKAPTA", "HBLUEBTA", "LBLUEBTA", "RASPBTA", "SASKBTA", "STRWBTA"],
+    "Cattle": ["BFCOWS", "BFHEIF", "BULLS", "CALFU1", "FDHEIF", "MLKCOW", "MLKHEIF", "STEERS"],
+    "Pigs": ["BOARS", "GRWPIG", "NRSPIG", "SOWS", "WEANPIG"],
+    "Sheep & Goats": ["EWES", "GOATS", "LAMBS", "MKTLAMBS", "RAMS", "REPLAMBS"],
+    "Chickens": ["BREEDCHK", "BROILER", "LAYHEN", "PULETS"],
+}
+
+# Every product code mapped to its label
+PRODUCT_LABELS = {code: label for products in CATEGORY_PRODUCTS.values() for code, label in products.items()}
+
+
+def category_codes(category):
+    """Product codes ranked within ``category``, including aggregate categories."""
+    members = AGGREGATE_CATEGORIES.get(category, [category])
+    return [code for member in members for code in CATEGORY_PRODUCTS.get(member, {})]
+
+
+def category_groups(category):
+    """Product groups that fall entirely within ``category``."""
+    codes = set(category_codes(category))
+    return [name for name, group in PRODUCT_GROUPS.items() if codes.issuperset(group)]
+
+
+def product_column(category, code):
+    """Dataset column holding ``code``'s values (greenhouse products use an ``_HA`` suffix)."""
+    if category == "🏡 Greenhouse Products":
+        return f"{code}_HA"
+    return code
@@ -0,0 +1,285 @@
+"""
+Columnar on-disk cache for the ADM2 agricultural dataset.
+
+The source GeoJSON is parsed once and compiled into two Parquet files:
+a GeoParquet file holding the geometry and identifying columns, and a
+plain Parquet attribute store holding every other column. Later loads
+read only the columns a view needs. The cache is rebuilt whenever the
+source file's modification time or size changes.
+
+Optionally the product matrix is also stored as a raw ``.npy`` array that
+every server process memory-maps read-only, so the OS page cache holds a
+single physical copy of the numeric columns per host.
+"""
+import json
+import os
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+import product_matrix
+
+# ATLAS_DATA_PATH points the app at another dataset, e.g. a synthetic one
+SOURCE_PATH = Path(os.environ.get("ATLAS_DATA_PATH", "data/canada_adm2_agricultural_stats.geojson"))
+CACHE_DIR = Path("data/.cache")
+
+GEOMETRY_FILE = "adm2_geometry.parquet"
+ATTRIBUTES_FILE = "adm2_attributes.parquet"
+MANIFEST_FILE = "manifest.json"
+MATRIX_FILE = "product_matrix.npy"
+MATRIX_MANIFEST_FILE = "product_matrix.json"
+
+# ATLAS_SHARED_MATRIX=1 maps the product matrix from MATRIX_FILE instead of
+# building a private copy in every process
+SHARED_MATRIX = os.environ.get("ATLAS_SHARED_MATRIX", "").lower() in ("1", "true", "yes", "on")
+
+# Columns stored alongside the geometry and always returned by load_columns
+KEY_COLUMNS = ["shapeName", "Province", "ADM2_KEY"]
+
+
+# ====================================================================
+# Cache Building
+# ====================================================================
+def source_fingerprint(source=SOURCE_PATH):
+    """Return the (mtime, size) fingerprint used to detect source changes."""
+    stat = Path(source).stat()
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _read_manifest(cache_dir):
+    manifest_path = Path(cache_dir) / MANIFEST_FILE
+    if not manifest_path.exists():
+        return None
+    try:
+        return json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _atomic_write(path, writer):
+    """Write via a temporary file so concurrent workers never see partial files."""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    writer(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def build_cache(source=SOURCE_PATH, cache_dir=CACHE_DIR):
+    """Parse the source GeoJSON and write the geometry and attribute stores."""
+    source = Path(source)
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    adm2 = gpd.read_file(source)
+
+    # Convert to WGS84 for web mapping
+    if adm2.crs != "EPSG:4326":
+        adm2 = adm2.to_crs("EPSG:4326")
+
+    key_columns = [c for c in KEY_COLUMNS if c in adm2.columns]
+    geometry_name = adm2.geometry.name
+    attribute_columns = [c for c in adm2.columns if c not in key_columns and c != geometry_name]
+
+    geometry_frame = adm2[key_columns + [geometry_name]]
+    attribute_frame = pd.DataFrame(adm2[attribute_columns])
+
+    _atomic_write(cache_dir / GEOMETRY_FILE, lambda p: geometry_frame.to_parquet(p, index=False))
+    _atomic_write(cache_dir / ATTRIBUTES_FILE, lambda p: attribute_frame.to_parquet(p, index=False))
+
+    manifest = {
+        "source": str(source),
+        "fingerprint": source_fingerprint(source),
+        "key_columns": key_columns,
+        "attribute_columns": attribute_columns,
+        "rows": len(adm2),
+    }
+    _atomic_write(cache_dir / MANIFEST_FILE, lambda p: p.write_text(json.dumps(manifest, indent=2)))
+    return manifest
+
+
+def ensure_cache(source=SOURCE_PATH, cache_dir=CACHE_DIR):
+    """Return the cache manifest, rebuilding the cache if the source has changed."""
+    source = Path(source)
+    if not source.exists():
+        raise FileNotFoundError(f"Data file not found at {source}")
+
+    manifest = _read_manifest(cache_dir)
+    files_present = all((Path(cache_dir) / f).exists() for f in (GEOMETRY_FILE, ATTRIBUTES_FILE))
+    if manifest is None or not files_present or manifest.get("fingerprint") != source_fingerprint(source):
+        manifest = build_cache(source, cache_dir)
+    return manifest
+
+
+# ====================================================================
+# Cache Reading
+# ====================================================================
+def load_columns(columns=None, source=SOURCE_PATH, cache_dir=CACHE_DIR):
+    """
+    Load geometry, the key columns and the requested attribute columns.
+
+    Columns that do not exist in the dataset are silently skipped so callers
+    can check membership afterwards. Passing ``columns=None`` loads everything.
+    """
+    manifest = ensure_cache(source, cache_dir)
+    cache_dir = Path(cache_dir)
+
+    geometry_frame = gpd.read_parquet(cache_dir / GEOMETRY_FILE)
+
+    if columns is None:
+        wanted = manifest["attribute_columns"]
+    else:
+        attribute_set = set(manifest["attribute_columns"])
+        wanted = list(dict.fromkeys(c for c in columns if c in attribute_set))
+
+    if not wanted:
+        return geometry_frame
+
+    attribute_frame = pd.read_parquet(cache_dir / ATTRIBUTES_FILE, columns=wanted)
+    attribute_frame.index = geometry_frame.index
+    return gpd.GeoDataFrame(
+        pd.concat([geometry_frame, attribute_frame], axis=1),
+        geometry=geometry_frame.geometry.name,
+        crs=geometry_frame.crs,
+    )
+
+
+# ====================================================================
+# Shared Product Matrix
+# ====================================================================
+def _write_array(path, values):
+    with open(path, "wb") as f:
+        np.save(f, values)
+
+
+def build_matrix_store(source=SOURCE_PATH, cache_dir=CACHE_DIR):
+    """Build the product matrix and write it as ``MATRIX_FILE`` plus its layout manifest."""
+    manifest = ensure_cache(source, cache_dir)
+    cache_dir = Path(cache_dir)
+    columns = product_matrix.matrix_columns()
+    matrix = product_matrix.build_product_matrix(load_columns(columns, source, cache_dir))
+
+    _atomic_write(cache_dir / MATRIX_FILE, lambda p: _write_array(p, matrix.values))
+    layout = {
+        "fingerprint": manifest["fingerprint"],
+        "matrix_columns": columns,
+        "codes": matrix.codes,
+        "columns": matrix.columns,
+        "category_ranges": matrix.category_ranges,
+        "shape": list(matrix.values.shape),
+    }
+    _atomic_write(cache_dir / MATRIX_MANIFEST_FILE, lambda p: p.write_text(json.dumps(layout, indent=2)))
+    return layout
+
+
+def load_shared_matrix(source=SOURCE_PATH, cache_dir=CACHE_DIR):
+    """
+    Memory-map the stored product matrix read-only, building it first if stale.
+
+    The store is rebuilt when the source file or the product catalog
+    changes. Every process mapping the same file shares its pages.
+    """
+    manifest = ensure_cache(source, cache_dir)
+    cache_dir = Path(cache_dir)
+
+    layout = None
+    layout_path = cache_dir / MATRIX_MANIFEST_FILE
+    if layout_path.exists() and (cache_dir / MATRIX_FILE).exists():
+        try:
+            layout = json.loads(layout_path.read_text())
+        except (OSError, ValueError):
+            layout = None
+    if (
+        layout is None
+        or layout.get("fingerprint") != manifest["fingerprint"]
+        or layout.get("matrix_columns") != product_matrix.matrix_columns()
+    ):
+        layout = build_matrix_store(source, cache_dir)
+
+    values = np.load(cache_dir / MATRIX_FILE, mmap_mode="r")
+    return product_matrix.ProductMatrix(
+        values,
+        layout["codes"],
+        layout["columns"],
+        {category: tuple(bounds) for category, bounds in layout["category_ranges"].items()},
+    )
+
+
+# ====================================================================
+# Row Indexes
+# ====================================================================
+def frame_memory(frame):
+    """
+    Bytes held by ``frame``'s columns and index, including string contents.
+
+    ``memory_usage`` only sees one pointer per geometry, so geometry
+    columns are counted as their coordinates instead: 16 bytes per
+    ``(x, y)`` pair.
+    """
+    usage = frame.memory_usage(index=True, deep=True)
+    geometry_columns = [c for c in frame.columns if isinstance(frame[c].dtype, gpd.array.GeometryDtype)]
+    for column in geometry_columns:
+        usage[column] = int(shapely.get_num_coordinates(frame[column].values).sum()) * 16
+    return int(usage.sum())
+
+
+def _downcast_float(values):
+    """Smallest lossless representation of a float column: integers, float32 or unchanged."""
+    if values.notna().all() and (values % 1 == 0).all():
+        return pd.to_numeric(values, downcast="integer")
+    as_float32 = values.astype(np.float32)
+    if np.array_equal(as_float32.to_numpy(dtype=np.float64), values.to_numpy(), equal_nan=True):
+        return as_float32
+    return values
+
+
+def compact_frame(frame, keep=None, category_max_ratio=0.5):
+    """
+    Shrink ``frame`` for long-lived sharing across reruns.
+
+    Drops columns not in ``keep`` (geometry is always kept), downcasts
+    numeric columns where the conversion is lossless, and stores string
+    columns whose distinct values are at most ``category_max_ratio`` of the
+    rows as ``category``. Returns ``(frame, footprint)`` where
+    ``footprint`` holds the ``before`` and ``after`` sizes in bytes of
+    ``frame`` as passed in and as returned, geometry included.
+    """
+    before = frame_memory(frame)
+    geometry_name = frame.geometry.name if isinstance(frame, gpd.GeoDataFrame) else None
+    if keep is not None:
+        keep = set(keep)
+        dropped = [c for c in frame.columns if c not in keep and c != geometry_name]
+        frame = frame.drop(columns=dropped)
+    else:
+        frame = frame.copy()
+
+    for column in frame.columns:
+        if column == geometry_name:
+            continue
+        values = frame[column]
+        if pd.api.types.is_float_dtype(values):
+            frame[column] = _downcast_float(values)
+        elif pd.api.types.is_integer_dtype(values):
+            frame[column] = pd.to_numeric(values, downcast="integer")
+        elif pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            if len(values) and values.nunique(dropna=True) <= category_max_ratio * len(values):
+                frame[column] = values.astype("category")
+
+    return frame, {"before": before, "after": frame_memory(frame)}
+
+
+def province_row_index(frame):
+    """Map each province to the sorted row positions of its divisions."""
+    codes, provinces = pd.factorize(frame["Province"], sort=True)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(provinces) + 1))
+    return {province: order[bounds[i]:bounds[i + 1]] for i, province in enumerate(provinces)}
+
+
+def select_rows(province_index, provinces):
+    """Sorted row positions of every division in ``provinces``."""
+    parts = [province_index[p] for p in provinces if p in province_index]
+    if not parts:
+        return np.empty(0, dtype=np.intp)
+    return np.sort(np.concatenate(parts))
@@ -0,0 +1,102 @@
+"""
+Lazy data export in CSV, Parquet and GeoJSON.
+
+Exports are only generated when a download is requested and are returned
+as ``bytes`` for ``st.download_button``. CSV and GeoJSON rows are encoded
+a chunk at a time, which keeps the intermediate per-row Python objects
+(feature dicts in particular) bounded; the finished file is held in
+memory, as Streamlit serves it from bytes.
+"""
+import io
+import json
+
+import geopandas as gpd
+import pandas as pd
+
+import data_store
+
+# Format name -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "GeoJSON": ("geojson", "application/geo+json"),
+}
+
+CHUNK_ROWS = 20_000
+
+
+# ====================================================================
+# Chunk Encoders
+# ====================================================================
+def iter_csv_chunks(frame, chunk_rows=CHUNK_ROWS):
+    """Yield the CSV encoding of ``frame`` as bytes, one row chunk at a time."""
+    frame = pd.DataFrame(frame.drop(columns=frame.geometry.name) if isinstance(frame, gpd.GeoDataFrame) else frame)
+    yield frame.iloc[:0].to_csv(index=False).encode("utf-8")
+    for start in range(0, len(frame), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows].to_csv(index=False, header=False).encode("utf-8")
+
+
+def iter_geojson_chunks(gdf, chunk_rows=CHUNK_ROWS):
+    """Yield a GeoJSON FeatureCollection for ``gdf`` as bytes, one row chunk at a time."""
+    yield b'{"type": "FeatureCollection", "features": ['
+    first = True
+    for start in range(0, len(gdf), chunk_rows):
+        features = gdf.iloc[start:start + chunk_rows].to_geo_dict(drop_id=True)["features"]
+        if not features:
+            continue
+        body = ", ".join(json.dumps(feature) for feature in features)
+        yield (body if first else ", " + body).encode("utf-8")
+        first = False
+    yield b"]}"
+
+
+# ====================================================================
+# Export Builders
+# ====================================================================
+def build_export(frame, fmt, chunk_rows=CHUNK_ROWS):
+    """
+    Encode ``frame`` in ``fmt`` (a key of ``EXPORT_FORMATS``) as ``bytes``.
+
+    GeoJSON requires a GeoDataFrame; CSV drops the geometry column; Parquet
+    keeps it as GeoParquet when present.
+    """
+    if fmt == "CSV":
+        return b"".join(iter_csv_chunks(frame, chunk_rows))
+    if fmt == "GeoJSON":
+        if not isinstance(frame, gpd.GeoDataFrame):
+            raise ValueError("GeoJSON export requires geometry")
+        return b"".join(iter_geojson_chunks(frame.to_crs("EPSG:4326"), chunk_rows))
+    if fmt == "Parquet":
+        buffer = io.BytesIO()
+        frame.to_parquet(buffer, index=False, row_group_size=chunk_rows)
+        return buffer.getvalue()
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def all_products_frame(matrix, positions, include_geometry=False, source=data_store.SOURCE_PATH,
+                       cache_dir=data_store.CACHE_DIR):
+    """
+    Every product column of ``matrix`` for the given row positions, at full precision.
+
+    Values are read from the columnar store rather than the float32
+    matrix, so large counts export exactly. Key columns (``shapeName``,
+    ``Province``, ``ADM2_KEY``) come first; geometry is included only
+    when requested.
+    """
+    frame = data_store.load_columns(list(matrix.columns), source, cache_dir).iloc[positions]
+    key_columns = [c for c in ("shapeName", "Province", "ADM2_KEY") if c in frame.columns]
+    products = pd.DataFrame(
+        {column: pd.to_numeric(frame[column], errors="coerce").fillna(0) for column in matrix.columns},
+        index=frame.index,
+    )
+    if include_geometry:
+        return gpd.GeoDataFrame(
+            pd.concat([frame[key_columns], products], axis=1),
+            geometry=frame.geometry.values,
+            crs=frame.crs,
+        )
+    return pd.concat([pd.DataFrame(frame[key_columns]), products], axis=1)
+
+
+def export_filename(stem, fmt):
+    return f"{stem}.{EXPORT_FORMATS[fmt][0]}"
@@ -0,0 +1,109 @@
+"""
+Geometry helpers for the map layers.
+
+Census-division polygons are simplified once into a small pyramid of
+resolution levels. The map builder picks a level from the zoom it is
+about to render at, so the national view ships far fewer vertices than
+a single-province view.
+"""
+import math
+
+import shapely
+
+# Simplification tolerance (degrees) for each level, keyed by the highest
+# zoom the level is used for. Zooms above the last key use full resolution.
+PYRAMID_LEVELS = {
+    4: 0.05,
+    5: 0.02,
+    6: 0.01,
+    8: 0.002,
+}
+FULL_RESOLUTION = None
+
+# Approximate on-screen map size used to estimate zoom from an extent
+MAP_WIDTH_PX = 900
+MAP_HEIGHT_PX = 600
+TILE_SIZE_PX = 256
+
+
+# ====================================================================
+# Geometry Pyramid
+# ====================================================================
+def simplify_coverage(geoseries, tolerance):
+    """
+    Simplify polygons while keeping shared borders between neighbours intact.
+
+    Uses shapely's coverage simplification when available (shapely >= 2.1),
+    which simplifies each shared edge once so adjacent divisions stay
+    gap-free. Older shapely versions fall back to per-polygon
+    topology-preserving simplification.
+    """
+    if hasattr(shapely, "coverage_simplify"):
+        simplified = shapely.coverage_simplify(geoseries.values, tolerance, simplify_boundary=True)
+        return geoseries.__class__(simplified, index=geoseries.index, crs=geoseries.crs)
+    return geoseries.simplify(tolerance, preserve_topology=True)
+
+
+def build_geometry_pyramid(geoseries, levels=PYRAMID_LEVELS):
+    """Return ``{max_zoom: simplified GeoSeries}`` plus the full-resolution level."""
+    pyramid = {max_zoom: simplify_coverage(geoseries, tolerance) for max_zoom, tolerance in levels.items()}
+    pyramid[FULL_RESOLUTION] = geoseries
+    return pyramid
+
+
+def select_level(pyramid, zoom):
+    """Pick the coarsest pyramid level that is still detailed enough for ``zoom``."""
+    for max_zoom in sorted(k for k in pyramid if k is not FULL_RESOLUTION):
+        if zoom <= max_zoom:
+            return max_zoom
+    return FULL_RESOLUTION
+
+
+def with_level_geometry(gdf, pyramid, level):
+    """Return a shallow copy of ``gdf`` whose geometry comes from the given pyramid level."""
+    layer = gdf.copy(deep=False)
+    layer[gdf.geometry.name] = pyramid[level].loc[gdf.index].values
+    return layer
+
+
+# ====================================================================
+# Zoom Estimation
+# ====================================================================
+def estimate_zoom(bounds, width_px=MAP_WIDTH_PX, height_px=MAP_HEIGHT_PX, max_zoom=10):
+    """Estimate the web-mercator zoom that fits ``(minx, miny, maxx, maxy)`` on screen."""
+    minx, miny, maxx, maxy = bounds
+    lon_span = max(maxx - minx, 1e-6)
+
+    # Latitude span in mercator units so northern extents are not underestimated
+    def merc(lat):
+        lat = max(min(lat, 85.0), -85.0)
+        return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+    lat_span = max(abs(merc(maxy) - merc(miny)), 1e-6)
+
+    zoom_x = math.log2(width_px * 360.0 / (TILE_SIZE_PX * lon_span))
+    zoom_y = math.log2(height_px * 2 * math.pi / (TILE_SIZE_PX * lat_span))
+    return max(0, min(int(math.floor(min(zoom_x, zoom_y))), max_zoom))
+
+
+# ====================================================================
+# Province Boundaries
+# ====================================================================
+PROVINCE_BOUNDARY_TOLERANCE = 0.01
+
+
+def build_province_boundaries(gdf, tolerance=PROVINCE_BOUNDARY_TOLERANCE):
+    """Dissolve divisions into simplified province outlines, indexed by province name."""
+    provinces = gdf[["Province", gdf.geometry.name]].dropna(subset=["Province"])
+    boundaries = provinces.dissolve(by="Province")
+    boundaries[boundaries.geometry.name] = simplify_coverage(boundaries.geometry, tolerance)
+    boundaries["Province"] = boundaries.index
+    boundaries.index.name = None
+    return boundaries
+
+
+def select_province_boundaries(boundaries, provinces=None):
+    """Return the cached outlines for ``provinces`` (all of them when ``None``)."""
+    if provinces is None:
+        return boundaries
+    return boundaries.loc[boundaries.index.intersection(provinces)]
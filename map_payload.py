@@ -0,0 +1,36 @@
+"""
+Slim GeoJSON payloads for the map layers.
+
+Folium serializes every column of a GeoDataFrame into each feature's
+properties. The builders here keep only the geometry, the tooltip
+fields and a precomputed style attribute, and report how many bytes
+the layer will add to the page.
+"""
+FILL_COLOR_COLUMN = "fill_color"
+
+
+def build_geojson_payload(gdf, fields, style_columns=(FILL_COLOR_COLUMN,)):
+    """
+    Serialize ``gdf`` to a GeoJSON string holding only the given columns.
+
+    ``fields`` are the tooltip fields; ``style_columns`` are precomputed style
+    attributes read by the layer's style function. Columns missing from
+    ``gdf`` are skipped.
+    """
+    columns = [c for c in dict.fromkeys([*fields, *style_columns]) if c in gdf.columns]
+    slim = gdf[columns + [gdf.geometry.name]]
+    return slim.to_json(drop_id=True)
+
+
+def payload_size(payload):
+    """Size in bytes of a serialized payload as it will be sent to the browser."""
+    return len(payload.encode("utf-8"))
+
+
+def format_size(num_bytes):
+    """Human-readable byte count, e.g. ``'1.4 MB'``."""
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size:,.0f} {unit}" if unit == "B" else f"{size:,.1f} {unit}"
+        size /= 1024
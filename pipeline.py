@@ -0,0 +1,811 @@
+"""
+Headless stages of the page pipeline.
+
+Filtering, top-product ranking, map styling and building, and chart
+construction live here as plain functions with no Streamlit calls, so
+the app, the benchmark suite and offline tools all run the same code.
+Section functions take the app's ``view`` dict of selections.
+
+folium, branca, plotly and the tile module are imported inside the
+functions that use them, so importing this module stays cheap.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from catalog import AGGREGATE_CATEGORIES, CATEGORIES, CATEGORY_PRODUCTS, PRODUCT_GROUPS, PRODUCT_LABELS, category_codes, product_column
+
+import data_store
+import geometry
+import map_payload
+import region_table
+import styling
+
+TOP_MODE = "Top Product per Region"
+PRODUCT_MODE = "Specific Product Distribution"
+
+CANADA_CENTER = (56.1304, -106.3468)
+CANADA_ZOOM = 4
+PROVINCE_ZOOM = 6
+
+# Embedded layer encoding: "topojson" (shared arcs, quantized) or "geojson"
+MAP_ENCODING = os.environ.get("ATLAS_MAP_ENCODING", "topojson")
+
+# Sankey flows kept per level before the rest are bucketed as "Other"
+SANKEY_MAX_LINKS = 25
+SANKEY_OTHER = "Other"
+SANKEY_OTHER_COLOR = '#95a5a6'
+
+BOUNDARY_STYLE = ({'fillColor': 'transparent', 'color': '#ffffff', 'weight': 2, 'fillOpacity': 0, 'opacity': 0.6}, ())
+
+# Fixed page scaffolding (basemap, plugins, templates) on top of a map's layer payloads
+MAP_OVERHEAD_BYTES = 32 * 1024
+
+BASEMAP_TILES = "https://{s}.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}{r}.png"
+BASEMAP_ATTRIBUTION = '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors &copy; <a href="https://carto.com/attributions">CARTO</a>'
+
+CATEGORICAL_PALETTE = [
+    '#9e0142', '#d53e4f', '#f46d43', '#fdae61', '#fee08b',
+    '#e6f598', '#abdda4', '#66c2a5', '#3288bd', '#5e4fa2'
+]
+
+# Category-specific color scales
+DEFAULT_COLOR_SCALE = ['#ffffe5', '#fff7bc', '#fee391', '#fec44f', '#fe9929', '#ec7014', '#cc4c02', '#993404', '#662506']
+CONTINUOUS_COLOR_SCALES = {
+    "🌾 Field Crops": DEFAULT_COLOR_SCALE,
+    "🥬 Vegetables": ['#f7fcf5', '#e5f5e0', '#c7e9c0', '#a1d99b', '#74c476', '#41ab5d', '#238b45', '#006d2c', '#00441b'],
+    "🍓 Fruits & Berries": ['#fff5f0', '#fee0d2', '#fcbba1', '#fc9272', '#fb6a4a', '#ef3b2c', '#cb181d', '#a50f15', '#67000d'],
+    "🏡 Greenhouse Products": ['#fcfbfd', '#efedf5', '#dadaeb', '#bcbddc', '#9e9ac8', '#807dba', '#6a51a3', '#54278f', '#3f007d'],
+    "🐄 Livestock": DEFAULT_COLOR_SCALE,
+    "🐔 Poultry": ['#fff5eb', '#fee6ce', '#fdd0a2', '#fdae6b', '#fd8d3c', '#f16913', '#d94801', '#a63603', '#7f2704'],
+}
+
+TOOLTIP_STYLE = """
+    background-color: rgba(255, 255, 255, 0.95);
+    color: #333;
+    border: 2px solid #333;
+    border-radius: 5px;
+    padding: 8px;
+    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+    box-shadow: 0 2px 6px rgba(0,0,0,0.3);
+"""
+
+PROVINCE_COLORS = {
+    'Ontario': '#1f77b4',
+    'Quebec / Québec': '#3498db',
+    'British Columbia / Colombie-Britannique': '#2ecc71',
+    'Alberta': '#e74c3c',
+    'Manitoba': '#f39c12',
+    'Saskatchewan': '#f1c40f',
+    'Nova Scotia / Nouvelle-Écosse': '#9b59b6',
+    'New Brunswick / Nouveau-Brunswick': '#e67e22',
+    'Newfoundland and Labrador / Terre-Neuve-et-Labrador': '#16a085',
+    'Prince Edward Island / Île-du-Prince-Édouard': '#e91e63',
+    'Northwest Territories / Territoires du Nord-Ouest': '#34495e',
+    'Nunavut': '#95a5a6',
+    'Yukon': '#d35400',
+}
+
+
+def is_all_canada(provinces):
+    return "All Canada" in provinces or len(provinces) == 0
+
+
+def make_view(category, analysis_mode=TOP_MODE, product=None, provinces=("All Canada",), group=None, top_k=1,
+              density=False):
+    """
+    The ``view`` dict of selections read by the section functions.
+
+    ``density`` colors specific-product maps by value per km²
+    (``map_col`` and ``map_unit``); it has no effect in top-product mode.
+    """
+    category_info = CATEGORIES[category]
+    col_name, col_value = category_info["columns"]
+    top_mode = analysis_mode == TOP_MODE
+    provinces = list(provinces)
+    value_col = col_value if top_mode else product_column(category, product)
+    density = bool(density) and not top_mode
+    return {
+        'category': category,
+        'category_info': category_info,
+        'analysis_mode': analysis_mode,
+        'product': product,
+        'product_label': CATEGORY_PRODUCTS.get(category, {}).get(product),
+        'group': group,
+        'top_k': top_k,
+        'rank_columns': rank_columns_for(col_name, col_value, top_k) if top_mode else [],
+        'provinces': provinces,
+        'chart_provinces': None if is_all_canada(provinces) else provinces,
+        'col_name': col_name,
+        'col_value': col_value,
+        'value_col': value_col,
+        'unit': category_info["unit"],
+        'density': density,
+        'map_col': density_column(value_col) if density else value_col,
+        'map_unit': f"{category_info['unit']}/km²" if density else category_info["unit"],
+    }
+
+
+def map_cache_key(view, show_values=True, show_boundaries=True, tile_mode=False):
+    """Render-cache key of the map drawn for ``view`` with the given display toggles."""
+    chart_provinces = view['chart_provinces']
+    return (
+        view['category'],
+        view['analysis_mode'],
+        view['product'],
+        view['group'],
+        view['top_k'],
+        tuple(sorted(chart_provinces)) if chart_provinces else ("All Canada",),
+        view['density'],
+        show_values,
+        show_boundaries,
+        tile_mode,
+    )
+
+
+# ====================================================================
+# Filtering and Ranking
+# ====================================================================
+def filter_rows(province_index, n_rows, provinces):
+    """Row positions of the selected provinces (every row for All Canada)."""
+    if province_index is None or is_all_canada(provinces):
+        return np.arange(n_rows)
+    return data_store.select_rows(province_index, provinces)
+
+
+def rank_columns_for(col_name, col_value, top_k):
+    """Label/value column pairs per rank; rank 1 uses the category's top columns."""
+    return [(col_name, col_value)] + [(f"{col_name}_{r}", f"{col_value}_{r}") for r in range(2, top_k + 1)]
+
+
+def top_product_view(adm2_data, matrix, row_positions, codes, col_name, col_value, top_k=1):
+    """
+    Rank ``codes`` per region and keep regions producing at least one of them.
+
+    Returns ``(map_data, row_positions, rank_columns)`` where ``map_data``
+    holds a label and value column per rank.
+    """
+    top_codes, top_values = matrix.top_k(codes, k=top_k)
+    row_positions = row_positions[top_values[row_positions, 0] > 0]
+    map_data = adm2_data.take(row_positions)
+
+    rank_columns = rank_columns_for(col_name, col_value, top_k)
+    for rank, (rank_name, rank_value) in enumerate(rank_columns):
+        map_data[rank_name] = pd.Series(top_codes[row_positions, rank], index=map_data.index).map(PRODUCT_LABELS)
+        map_data[rank_value] = top_values[row_positions, rank].astype(np.float64)
+    return map_data, row_positions, rank_columns
+
+
+def product_view(adm2_data, matrix, row_positions, code, value_col):
+    """Regions producing ``code``, with its values in ``value_col``; returns ``(map_data, row_positions)``."""
+    row_positions = matrix.producing_rows(code, row_positions)
+    map_data = adm2_data.take(row_positions)
+    map_data[value_col] = matrix.column(code)[row_positions].astype(np.float64)
+    return map_data, row_positions
+
+
+def ranked_codes(category, group=None):
+    """Product codes ranked in top-product mode: a product group, or the whole category."""
+    return PRODUCT_GROUPS[group] if group else category_codes(category)
+
+
+def view_data(view, adm2_data, matrix, row_positions, regions=None):
+    """
+    ``(map_data, row_positions)`` for ``view``, dispatching on its analysis mode.
+
+    Density views need ``regions``, the ``region_table.RegionTable``.
+    """
+    if view['analysis_mode'] == TOP_MODE:
+        map_data, row_positions, _ = top_product_view(
+            adm2_data, matrix, row_positions, ranked_codes(view['category'], view['group']),
+            view['col_name'], view['col_value'], view['top_k']
+        )
+        return map_data, row_positions
+    map_data, row_positions = product_view(adm2_data, matrix, row_positions, view['product'], view['value_col'])
+    if view['density']:
+        add_density(map_data, row_positions, regions, view['value_col'])
+    return map_data, row_positions
+
+
+def density_column(value_col):
+    """Name of the per-km² column derived from ``value_col``."""
+    return f"{value_col}_PER_KM2"
+
+
+def add_density(map_data, row_positions, regions, value_col):
+    """Add ``value_col`` per km² of land, from the precomputed region areas."""
+    area = regions.area_km2(row_positions)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        density = np.where(area > 0, map_data[value_col].to_numpy(dtype=np.float64) / area, 0.0)
+    map_data[density_column(value_col)] = density
+
+
+def chart_inputs(view, cube):
+    """
+    ``(top_product_stats, province_totals)`` for the charts of ``view``.
+
+    Both slice the precomputed ``aggregates.AggregationCube``;
+    ``top_product_stats`` is ``None`` in specific-product mode.
+    """
+    if view['analysis_mode'] == TOP_MODE:
+        codes = ranked_codes(view['category'], view['group'])
+        top_product_stats = cube.top_product_stats(codes, view['chart_provinces'])
+        top_product_stats[view['col_name']] = top_product_stats['Product'].map(PRODUCT_LABELS)
+        return top_product_stats, cube.top_province_stats(codes, view['chart_provinces'])
+    return None, cube.product_stats(view['product'], view['chart_provinces'])
+
+
+def region_breakdown(matrix, position, category):
+    """
+    Every product of ``category`` produced by the region at row ``position``.
+
+    Aggregate categories list the products of each member category.
+    Returns ``Category``, ``Product`` and ``Value`` columns, largest first.
+    """
+    parts = []
+    for member in AGGREGATE_CATEGORIES.get(category, [category]):
+        if member not in matrix.category_ranges:
+            continue
+        values = matrix.category(member)[position]
+        producing = np.flatnonzero(values > 0)
+        codes = matrix.category_codes(member)
+        parts.append(pd.DataFrame({
+            'Category': member,
+            'Product': [PRODUCT_LABELS[codes[j]] for j in producing],
+            'Value': values[producing].astype(np.float64),
+        }))
+    if not parts:
+        return pd.DataFrame(columns=['Category', 'Product', 'Value'])
+    breakdown = pd.concat(parts, ignore_index=True)
+    return breakdown.sort_values('Value', ascending=False, kind='stable').reset_index(drop=True)
+
+
+# ====================================================================
+# Map Styling
+# ====================================================================
+def color_scale(category):
+    return CONTINUOUS_COLOR_SCALES.get(category, DEFAULT_COLOR_SCALE)
+
+
+def categorical_palette(n):
+    """At least ``n`` distinct colors for product labels."""
+    if n <= len(CATEGORICAL_PALETTE):
+        return CATEGORICAL_PALETTE
+    return styling.distinct_colors(n)
+
+
+def feature_style(spec):
+    """
+    Folium style function for a ``(base, color_keys)`` style spec.
+
+    Every key in ``color_keys`` takes the feature's precomputed fill color;
+    the rest of the style comes from ``base``.
+    """
+    base, color_keys = spec
+
+    def style_function(feature):
+        if not color_keys:
+            return dict(base)
+        color = feature['properties'][map_payload.FILL_COLOR_COLUMN]
+        return {**base, **{key: color for key in color_keys}}
+
+    return style_function
+
+
+def style_layer(view, map_data, layer_data):
+    """
+    Add the fill color column to ``layer_data`` and describe the layer.
+
+    Returns ``(style, highlight, tooltip_fields, tooltip_aliases,
+    product_colors)``; ``style`` and ``highlight`` are ``(base, color_keys)``
+    specs for ``feature_style``, and ``product_colors`` is ``None`` in
+    specific-product mode.
+    """
+    col_name, col_value, value_col = view['col_name'], view['col_value'], view['value_col']
+    unit = view['unit']
+
+    if view['analysis_mode'] == TOP_MODE:
+        # CATEGORICAL COLOR MAP
+        unique_products = map_data[col_name].dropna().unique()
+        colors = categorical_palette(len(unique_products))
+
+        # One factorize pass assigns every region its palette color
+        layer_data[map_payload.FILL_COLOR_COLUMN], product_colors = styling.categorical_colors(
+            layer_data[col_name], colors[:len(unique_products)]
+        )
+
+        style = ({'fillOpacity': 0.6, 'weight': 1.5, 'opacity': 0.9}, ('fillColor', 'color'))
+        highlight = ({'fillOpacity': 0.85, 'weight': 3, 'color': '#ffffff', 'opacity': 1}, ('fillColor',))
+
+        tooltip_fields = ["shapeName", col_name, col_value]
+        tooltip_aliases = ["Region:", "Product:", f"Value ({unit}):"]
+
+        for rank, (rank_name, rank_value) in enumerate(view['rank_columns'][1:], start=2):
+            tooltip_fields += [rank_name, rank_value]
+            tooltip_aliases += [f"#{rank} Product:", f"#{rank} Value ({unit}):"]
+
+    else:
+        # CONTINUOUS COLOR SCALE
+        import branca.colormap as cm
+
+        map_col = view['map_col']
+        product_colors = None
+        colormap = cm.LinearColormap(
+            colors=color_scale(view['category']),
+            vmin=map_data[map_col].min(),
+            vmax=map_data[map_col].max()
+        )
+
+        # Interpolate all region colors over the colormap stops in one pass
+        layer_data[map_payload.FILL_COLOR_COLUMN] = styling.colormap_colors(layer_data[map_col], colormap)
+
+        style = ({'fillOpacity': 0.7, 'color': '#666666', 'weight': 1, 'opacity': 0.8}, ('fillColor',))
+        highlight = ({'fillOpacity': 0.9, 'weight': 3, 'color': '#ffffff'}, ())
+
+        tooltip_fields = ["shapeName", value_col]
+        tooltip_aliases = ["Region:", f"{view['product_label']} ({unit}):"]
+        if view['density']:
+            tooltip_fields.append(map_col)
+            tooltip_aliases.append(f"Density ({view['map_unit']}):")
+
+    if "Province" in map_data.columns:
+        tooltip_fields.insert(1, "Province")
+        tooltip_aliases.insert(1, "Province:")
+
+    return style, highlight, tooltip_fields, tooltip_aliases, product_colors
+
+
+# ====================================================================
+# Map Building
+# ====================================================================
+def map_viewport(view, map_data, regions=None):
+    """
+    Return ``(center, zoom_start, detail_zoom)`` fitting the selection.
+
+    Province selections are framed from ``regions`` (a
+    ``region_table.RegionTable``) without touching geometry; without one,
+    the bounds of ``map_data`` are used.
+    """
+    if is_all_canada(view['provinces']):
+        return CANADA_CENTER, CANADA_ZOOM, CANADA_ZOOM
+    bounds = regions.province_bounds(view['provinces']) if regions is not None else None
+    if bounds is None:
+        bounds = tuple(map_data.total_bounds)
+    zoom_start = geometry.estimate_zoom(bounds)
+    return region_table.bounds_center(bounds), zoom_start, max(PROVINCE_ZOOM, zoom_start)
+
+
+def build_map(view, map_data, pyramid, province_boundaries=None, show_values=True, tile_mode=False, viewport_culling=False,
+              encoding=MAP_ENCODING, regions=None):
+    """
+    Build the folium map for a view.
+
+    ``province_boundaries`` (from ``geometry.build_province_boundaries``)
+    adds the outline layer when given. ``tile_mode`` expects the vector
+    tile endpoint to be running already. With ``viewport_culling`` the region
+    layer is left out of the page and its per-region colors and labels
+    are returned for ``viewport.region_delta`` to send as the map pans.
+    Embedded layers are sent as quantized TopoJSON unless ``encoding`` is
+    ``"geojson"``. ``regions`` (a ``region_table.RegionTable``) frames the
+    map on the selection. Returns ``(m, info)`` where ``info`` holds ``product_colors``,
+    ``payload_bytes``, ``features``, ``center``, ``zoom_start`` and, in
+    viewport mode, ``viewport``.
+    """
+    import folium
+
+    center, zoom_start, detail_zoom = map_viewport(view, map_data, regions)
+
+    # Pick a simplified geometry level for the zoom and selection extent
+    layer_data = geometry.with_level_geometry(map_data, pyramid, geometry.select_level(pyramid, detail_zoom))
+
+    # Create folium map with dark basemap
+    m = folium.Map(
+        location=list(center),
+        zoom_start=zoom_start,
+        tiles=BASEMAP_TILES,
+        attr=BASEMAP_ATTRIBUTION,
+        control_scale=True
+    )
+
+    payload_bytes = 0
+    viewport_layer = None
+
+    # Add province boundaries (if enabled)
+    if province_boundaries is not None and 'Province' in map_data.columns:
+        province_boundaries = geometry.select_province_boundaries(
+            province_boundaries, map_data['Province'].dropna().unique()
+        )
+        if encoding == "topojson":
+            import topology
+
+            boundary_payload = topology.encode(province_boundaries, ['Province'], topology.quantization_step(detail_zoom))
+            topology.TopoJsonLayer(
+                boundary_payload,
+                BOUNDARY_STYLE,
+                fields=['Province'],
+                aliases=['Province:'],
+                name="Province Boundaries",
+            ).add_to(m)
+        else:
+            boundary_payload = map_payload.build_geojson_payload(province_boundaries, ['Province'], style_columns=())
+            folium.GeoJson(
+                boundary_payload,
+                name="Province Boundaries",
+                style_function=feature_style(BOUNDARY_STYLE),
+                tooltip=folium.GeoJsonTooltip(
+                    fields=['Province'],
+                    aliases=['Province:'],
+                    localize=True
+                )
+            ).add_to(m)
+        payload_bytes += map_payload.payload_size(boundary_payload)
+
+    style, highlight, tooltip_fields, tooltip_aliases, product_colors = style_layer(
+        view, map_data, layer_data
+    )
+    # Lower ranks a region has no product for are left out of its tooltip
+    rank_requires = {rank_value: rank_name for rank_name, rank_value in view['rank_columns'][1:]}
+
+    if tile_mode:
+        import tiles
+
+        # Vector tile mode only embeds per-region colors and labels
+        region_colors, region_labels = tiles.region_attributes(
+            layer_data,
+            layer_data[map_payload.FILL_COLOR_COLUMN],
+            tiles.tooltip_labels(layer_data, tooltip_fields, tooltip_aliases, rank_requires) if show_values else None
+        )
+        payload_bytes += tiles.add_vector_tile_layer(m, region_colors, style, highlight, region_labels)
+    elif viewport_culling:
+        import tiles
+        import viewport
+
+        # Geometry is attached per viewport delta; keep only what styles a feature
+        attributes = pd.DataFrame({map_payload.FILL_COLOR_COLUMN: layer_data[map_payload.FILL_COLOR_COLUMN]})
+        if show_values:
+            attributes[viewport.LABEL_COLUMN] = tiles.tooltip_labels(layer_data, tooltip_fields, tooltip_aliases, rank_requires)
+        viewport_layer = {'attributes': attributes, 'style': style, 'highlight': highlight}
+    elif encoding == "topojson":
+        import topology
+
+        # Shared borders are sent once, on a grid fine enough for the zoom
+        layer_payload = topology.encode(
+            layer_data, [*tooltip_fields, map_payload.FILL_COLOR_COLUMN], topology.quantization_step(detail_zoom)
+        )
+        payload_bytes += map_payload.payload_size(layer_payload)
+
+        topology.TopoJsonLayer(
+            layer_payload,
+            style,
+            highlight,
+            fields=tooltip_fields if show_values else (),
+            aliases=tooltip_aliases if show_values else (),
+            name="Agricultural Products",
+            color_property=map_payload.FILL_COLOR_COLUMN,
+            tooltip_style=TOOLTIP_STYLE,
+        ).add_to(m)
+    else:
+        # Add GeoJson layer with only the tooltip fields and precomputed colors
+        layer_payload = map_payload.build_geojson_payload(layer_data, tooltip_fields)
+        payload_bytes += map_payload.payload_size(layer_payload)
+
+        folium.GeoJson(
+            layer_payload,
+            name="Agricultural Products",
+            style_function=feature_style(style),
+            highlight_function=feature_style(highlight),
+            tooltip=folium.GeoJsonTooltip(
+                fields=tooltip_fields,
+                aliases=tooltip_aliases,
+                localize=True,
+                sticky=False,
+                labels=True,
+                style=TOOLTIP_STYLE,
+            ) if show_values else None
+        ).add_to(m)
+
+    folium.LayerControl().add_to(m)
+
+    info = {
+        'product_colors': product_colors,
+        'payload_bytes': payload_bytes,
+        'features': len(layer_data),
+        'center': center,
+        'zoom_start': zoom_start,
+    }
+    if viewport_layer is not None:
+        info['viewport'] = viewport_layer
+    return m, info
+
+
+def cached_map_size(info):
+    """
+    Rough size of a built map for render-cache accounting.
+
+    Counts the layer payloads, a fixed allowance for the page scaffolding
+    and any viewport attribute table; the folium objects themselves are not
+    measured.
+    """
+    size = info['payload_bytes'] + MAP_OVERHEAD_BYTES
+    if 'viewport' in info:
+        size += int(info['viewport']['attributes'].memory_usage(deep=True).sum())
+    return size
+
+
+def render_map(m):
+    """Render a folium map to a standalone HTML document."""
+    return m.get_root().render()
+
+
+# ====================================================================
+# Charts
+# ====================================================================
+def bar_chart(view, adm2_data, matrix, row_positions, top_product_stats):
+    """Top 10 products (top-product mode) or top 10 regions (specific-product mode)."""
+    import plotly.express as px
+
+    unit = view['unit']
+    top_mode = view['analysis_mode'] == TOP_MODE
+
+    if top_mode:
+        product_summary = top_product_stats.groupby(view['col_name'])['sum'].sum().sort_values(ascending=False).head(10)
+        chart_title = f"Top 10 Products by Total Value ({unit})"
+    else:
+        top_rows = matrix.top_regions(view['product'], row_positions, k=10)
+        product_summary = pd.Series(
+            matrix.column(view['product'])[top_rows],
+            index=adm2_data['shapeName'].to_numpy()[top_rows]
+        )
+        chart_title = f"Top 10 Regions - {view['product_label']} ({unit})"
+
+    fig_bar = px.bar(
+        x=product_summary.values,
+        y=product_summary.index,
+        orientation='h',
+        labels={'x': f'Total Value ({unit})', 'y': 'Product' if top_mode else 'Region'},
+        title=chart_title,
+        color=product_summary.values,
+        color_continuous_scale=view['category_info']["color"]
+    )
+    fig_bar.update_layout(
+        showlegend=False,
+        height=450,
+        yaxis={'categoryorder': 'total ascending'}
+    )
+    return fig_bar
+
+
+def bubble_chart(view, province_totals):
+    """Provincial scale (producing regions) against intensity (average per region)."""
+    import plotly.express as px
+
+    unit = view['unit']
+
+    # Calculate statistics per province
+    province_stats = province_totals[['Province', 'sum', 'mean', 'count']].copy()
+    province_stats.columns = ['Province', 'Total_Production', 'Avg_Per_Region', 'Num_Regions']
+
+    # Sort by total production and get top 10
+    province_stats = province_stats.nlargest(10, 'Total_Production')
+
+    fig_bubble = px.scatter(
+        province_stats,
+        x='Num_Regions',
+        y='Total_Production',
+        size='Avg_Per_Region',
+        color='Province',
+        hover_name='Province',
+        hover_data={
+            'Num_Regions': ':,',
+            'Total_Production': ':,.0f',
+            'Avg_Per_Region': ':,.0f',
+            'Province': False
+        },
+        labels={
+            'Num_Regions': 'Number of Producing Regions',
+            'Total_Production': f'Total Production ({unit})',
+            'Avg_Per_Region': f'Avg per Region ({unit})'
+        },
+        title="Provincial Overview: Scale vs Intensity",
+        size_max=60
+    )
+
+    fig_bubble.update_layout(
+        showlegend=True,
+        height=450,
+        legend=dict(
+            orientation="v",
+            yanchor="top",
+            y=1,
+            xanchor="left",
+            x=1.02,
+            font=dict(size=9)
+        ),
+        xaxis=dict(gridcolor='lightgray'),
+        yaxis=dict(gridcolor='lightgray')
+    )
+    return fig_bubble
+
+
+def province_chart(view, province_totals, regions=None):
+    """Top 10 provinces by total production, or by production per km² in density views."""
+    import plotly.express as px
+
+    unit = view['unit']
+
+    province_summary = province_totals.set_index('Province')[['sum', 'count']].rename(columns={
+        'sum': 'Total Production',
+        'count': 'Number of Regions'
+    })
+    measure, measure_label = 'Total Production', f'Total Value ({unit})'
+    title = f"Top 10 Provinces by Total Production ({unit})"
+    if view['density'] and regions is not None:
+        area = regions.province_area_km2(province_summary.index)
+        province_summary['Density'] = province_summary['Total Production'].to_numpy() / area
+        measure, measure_label = 'Density', f"Production per km² ({view['map_unit']})"
+        title = f"Top 10 Provinces by Production Density ({view['map_unit']})"
+    province_summary = province_summary.sort_values(measure, ascending=False)
+
+    fig_province = px.bar(
+        province_summary.head(10),
+        y=province_summary.head(10).index,
+        x=measure,
+        orientation='h',
+        title=title,
+        labels={'y': 'Province', measure: measure_label},
+        text=measure,
+        color=province_summary.head(10).index,
+        color_discrete_map=PROVINCE_COLORS
+    )
+    fig_province.update_traces(texttemplate='%{text:.2s}', textposition='outside')
+    fig_province.update_layout(
+        height=500,
+        yaxis={'categoryorder': 'total ascending'},
+        showlegend=False
+    )
+    return fig_province
+
+
+def sankey_links(paths, levels, value_col, max_links=SANKEY_MAX_LINKS, label_columns=None):
+    """
+    Nodes and links of a Sankey through the ``levels`` columns of ``paths``.
+
+    Nodes are the distinct values of each level column; ``label_columns``
+    maps a level to the column its node labels are read from (e.g. region
+    keys labelled by region name).
+
+    Every level past the first keeps the ``max_links`` largest branches
+    (path prefixes ending at that level); rows of the other branches flow
+    into the level's ``Other`` node from there on, so every total is kept.
+    Returns ``(nodes, links)``: ``nodes`` has ``label``, ``level`` and
+    ``other`` columns, ``links`` has ``source``, ``target`` (node
+    positions) and ``value``, largest first.
+    """
+    values = paths[value_col].to_numpy(dtype=np.float64)
+    label_columns = label_columns or {}
+    codes, labels = [], []
+    for level in levels:
+        level_codes, uniques = pd.factorize(paths[level])
+        other = len(uniques)
+        level_labels = np.asarray(uniques, dtype=object)
+        if level in label_columns:
+            # Label each node from its first row
+            _, first = np.unique(level_codes, return_index=True)
+            first = first[level_codes[first] >= 0]
+            level_labels = paths[label_columns[level]].to_numpy(dtype=object)[first]
+        codes.append(np.where(level_codes < 0, other, level_codes))
+        labels.append(np.append(level_labels, SANKEY_OTHER))
+
+    # Bucket the small branches level by level
+    prefix = codes[0]
+    for d in range(1, len(levels)):
+        width = len(labels[d])
+        _, branch = np.unique(prefix * width + codes[d], return_inverse=True)
+        totals = np.bincount(branch, weights=values)
+        if len(totals) > max_links:
+            keep = np.zeros(len(totals), dtype=bool)
+            keep[np.argpartition(-totals, max_links - 1)[:max_links]] = True
+            small = ~keep[branch]
+            for deeper in range(d, len(levels)):
+                codes[deeper][small] = len(labels[deeper]) - 1
+            _, branch = np.unique(prefix * width + codes[d], return_inverse=True)
+        prefix = branch
+
+    # Number the nodes that carry flow, level by level
+    offsets = np.cumsum([0] + [len(level_labels) for level_labels in labels])
+    node_ids = [offsets[d] + level_codes for d, level_codes in enumerate(codes)]
+    used, inverse = np.unique(np.concatenate(node_ids), return_inverse=True)
+    node_ids = np.split(inverse, len(levels))
+    level_of = np.searchsorted(offsets, used, side='right') - 1
+    all_labels = np.concatenate(labels)
+    nodes = pd.DataFrame({
+        'label': all_labels[used],
+        'level': level_of,
+        'other': used == offsets[level_of + 1] - 1,
+    })
+
+    # Sum the flows between adjacent levels
+    pairs = np.concatenate([
+        np.stack([node_ids[d], node_ids[d + 1]], axis=1) for d in range(len(levels) - 1)
+    ]) if len(levels) > 1 else np.empty((0, 2), dtype=np.intp)
+    weights = np.tile(values, len(levels) - 1)
+    link_pairs, link_index = np.unique(pairs, axis=0, return_inverse=True)
+    link_values = np.bincount(link_index.ravel(), weights=weights, minlength=len(link_pairs))
+    order = np.argsort(-link_values, kind='stable')
+    order = order[link_values[order] > 0]
+    links = pd.DataFrame({
+        'source': link_pairs[order, 0],
+        'target': link_pairs[order, 1],
+        'value': link_values[order],
+    })
+    return nodes, links
+
+
+def sankey_chart(view, map_data, top_product_stats, max_links=SANKEY_MAX_LINKS, by_division=False):
+    """
+    Province to product (top-product mode) or province to region flow figure.
+
+    ``by_division`` adds a census division level between provinces and
+    products in top-product mode. Each level keeps its ``max_links``
+    largest flows and buckets the rest as ``Other`` (see
+    ``sankey_links``). Returns a plotly figure dict.
+    """
+    unit = view['unit']
+    col_name, col_value, value_col = view['col_name'], view['col_value'], view['value_col']
+
+    if view['analysis_mode'] == TOP_MODE and by_division:
+        # Each region's top product, through its census division
+        paths, flow_col = map_data, col_value
+        levels, level_colors = ['Province', 'ADM2_KEY', col_name], ['#3498db', '#9b59b6', '#e74c3c']
+        title = f'Province to Census Division to Product Flow (Top {max_links} per Level)'
+    elif view['analysis_mode'] == TOP_MODE:
+        # Province-product totals from the aggregation cube
+        paths, flow_col = top_product_stats, 'sum'
+        levels, level_colors = ['Province', col_name], ['#3498db', '#e74c3c']
+        title = f'Province to Product Flow (Top {max_links} Combinations)'
+    else:
+        # For specific product, show province -> region sankey
+        paths, flow_col = map_data, value_col
+        levels, level_colors = ['Province', 'ADM2_KEY'], ['#3498db', '#2ecc71']
+        title = f"{view['product_label']} Production: Province to Region Flow (Top {max_links})"
+
+    # Regions are told apart by key; names like "Division No. 1" repeat across provinces
+    nodes, links = sankey_links(paths, levels, flow_col, max_links, label_columns={'ADM2_KEY': 'shapeName'})
+
+    # Color nodes by level, with "Other" buckets in grey
+    node_colors = np.where(nodes['other'], SANKEY_OTHER_COLOR, np.asarray(level_colors, dtype=object)[nodes['level']])
+    labels = nodes['label'].astype(str).tolist()
+    source, target, values = links['source'].tolist(), links['target'].tolist(), links['value'].tolist()
+    node_colors = node_colors.tolist()
+
+    return {
+        'data': [{
+            'type': 'sankey',
+            'node': {
+                'pad': 20,
+                'thickness': 25,
+                'line': {'color': 'white', 'width': 1},
+                'label': labels,
+                'color': node_colors,
+                'hovertemplate': '%{label}<br>%{value:,.0f} ' + unit + '<extra></extra>'
+            },
+            'link': {
+                'source': source,
+                'target': target,
+                'value': values,
+                'color': 'rgba(255,255,255,0.3)',  # White with transparency
+                'hovertemplate': '%{source.label} → %{target.label}<br>%{value:,.0f} ' + unit + '<extra></extra>'
+            }
+        }],
+        'layout': {
+            'title': {
+                'text': title,
+                'font': {'size': 18}
+            },
+            'height': 600,
+            'font': {'size': 11},
+            'plot_bgcolor': 'rgba(0,0,0,0)',
+            'paper_bgcolor': 'rgba(0,0,0,0)'
+        }
+    }
@@ -0,0 +1,279 @@
+"""
+Offline pre-renderer for every category x product x province view.
+
+Renders the same maps and charts as the app through ``pipeline``: for
+every category its top-product view and one view per product, each for
+All Canada and every province. Each view becomes a standalone map HTML
+file and a JSON file of its Plotly charts. Views render in parallel on
+a process pool; workers map the shared product matrix (see
+``data_store.load_shared_matrix``) instead of building their own.
+
+Runs are incremental. Every view's digest covers the rendering code and
+map encoding, the dataset geometry and the view's own region values, and
+views whose digest matches the previous run are skipped.
+
+    python -m prerender --output prerendered --workers 8
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from catalog import CATEGORIES, CATEGORY_PRODUCTS, category_codes
+
+import aggregates
+import catalog
+import data_store
+import geometry
+import map_payload
+import pipeline
+import product_matrix
+import region_table
+import styling
+import topology
+
+DEFAULT_OUTPUT = Path("prerendered")
+MANIFEST_FILE = "manifest.json"
+ALL_CANADA = "All Canada"
+TOP_SLUG = "top"
+
+# Modules whose source changes invalidate every artifact
+CODE_MODULES = (
+    aggregates, catalog, geometry, map_payload, pipeline, product_matrix, region_table, styling, topology,
+    sys.modules[__name__],
+)
+
+# Per-worker data, loaded once by _init_worker
+_state = {}
+
+
+# ====================================================================
+# Views
+# ====================================================================
+def slug(text):
+    """Lowercase ASCII file-name slug, e.g. ``'🌾 Field Crops'`` -> ``'field-crops'``."""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+def view_specs(provinces, categories=None, modes=(pipeline.TOP_MODE, pipeline.PRODUCT_MODE)):
+    """
+    ``(category, analysis_mode, product, province)`` for every view to render.
+
+    ``provinces`` are the dataset's provinces; All Canada comes first.
+    Aggregate categories (All Crops, All Animals) only get the top-product
+    view, as in the app.
+    """
+    for category in categories or CATEGORIES:
+        products = [None] if pipeline.TOP_MODE in modes else []
+        if pipeline.PRODUCT_MODE in modes and category in CATEGORY_PRODUCTS:
+            products += category_codes(category)
+        for product in products:
+            mode = pipeline.TOP_MODE if product is None else pipeline.PRODUCT_MODE
+            for province in [ALL_CANADA, *provinces]:
+                yield category, mode, product, province
+
+
+def artifact_stem(spec):
+    """Relative path of a view's artifacts without extension."""
+    category, _, product, province = spec
+    return Path(slug(category)) / (product or TOP_SLUG) / slug(province)
+
+
+def code_digest(modules=CODE_MODULES):
+    """Digest of the rendering code's source files and the map encoding they use."""
+    digest = hashlib.sha256(pipeline.MAP_ENCODING.encode("utf-8"))
+    for module in modules:
+        digest.update(Path(module.__file__).read_bytes())
+    return digest.hexdigest()
+
+
+def geometry_digest(geometries):
+    """Digest of every region geometry, in row order."""
+    digest = hashlib.sha256()
+    for wkb in shapely.to_wkb(np.asarray(geometries)):
+        digest.update(wkb)
+    return digest.hexdigest()
+
+
+def view_digest(base_digest, spec, map_data, row_positions):
+    """Digest of everything one view's artifacts are rendered from."""
+    digest = hashlib.sha256(base_digest.encode("ascii"))
+    digest.update(json.dumps(spec, ensure_ascii=False).encode("utf-8"))
+    digest.update(np.ascontiguousarray(row_positions, dtype=np.int64).tobytes())
+    attributes = pd.DataFrame(map_data.drop(columns=map_data.geometry.name))
+    digest.update(pd.util.hash_pandas_object(attributes, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+# ====================================================================
+# Rendering
+# ====================================================================
+def build_charts(view, adm2_data, matrix, map_data, row_positions, cube):
+    """The page's charts for ``view`` as ``{name: figure}``, shown under the app's conditions."""
+    top_product_stats, province_totals = pipeline.chart_inputs(view, cube)
+    charts = {
+        "bar": pipeline.bar_chart(view, adm2_data, matrix, row_positions, top_product_stats),
+        "bubble": pipeline.bubble_chart(view, province_totals),
+    }
+    if 'Province' in map_data.columns and len(map_data) > 5:
+        charts["sankey"] = pipeline.sankey_chart(view, map_data, top_product_stats)
+    if 'Province' in map_data.columns and pipeline.is_all_canada(view['provinces']):
+        charts["province_comparison"] = pipeline.province_chart(view, province_totals)
+    return charts
+
+
+def _write_text(path, text):
+    """Write via a temporary file so readers never see a partial artifact."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _init_worker(source, cache_dir):
+    adm2_data = data_store.load_columns([], source, cache_dir)
+    matrix = data_store.load_shared_matrix(source, cache_dir)
+    province_index = data_store.province_row_index(adm2_data)
+    _state.update(
+        adm2_data=adm2_data,
+        matrix=matrix,
+        province_index=province_index,
+        cube=aggregates.AggregationCube(matrix, province_index),
+        pyramid=geometry.build_geometry_pyramid(adm2_data.geometry),
+        boundaries=geometry.build_province_boundaries(adm2_data),
+        regions=region_table.RegionTable(adm2_data.geometry, province_index),
+    )
+
+
+def render_view(spec, output, base_digest, previous_digest=None, force=False):
+    """
+    Render one view's map and charts unless its digest is unchanged.
+
+    Runs in a worker process. Returns ``(spec, digest, status)`` with
+    status ``'rendered'``, ``'skipped'``, ``'empty'`` or ``'failed'``; a
+    failed view keeps no digest so the next run retries it.
+    """
+    try:
+        return _render_view(spec, output, base_digest, previous_digest, force)
+    except Exception as e:
+        print(f"  failed {artifact_stem(spec)}: {e!r}", file=sys.stderr, flush=True)
+        return spec, None, "failed"
+
+
+def _render_view(spec, output, base_digest, previous_digest, force):
+    category, mode, product, province = spec
+    adm2_data, matrix = _state['adm2_data'], _state['matrix']
+
+    view = pipeline.make_view(category, mode, product=product, provinces=[province])
+    row_positions = pipeline.filter_rows(_state['province_index'], len(adm2_data), view['provinces'])
+    map_data, row_positions = pipeline.view_data(view, adm2_data, matrix, row_positions)
+
+    digest = view_digest(base_digest, spec, map_data, row_positions)
+    stem = Path(output) / artifact_stem(spec)
+    if not force and digest == previous_digest and (map_data.empty or stem.with_suffix(".html").exists()):
+        return spec, digest, "skipped"
+    if map_data.empty:
+        # Drop artifacts left from when the view had data
+        for suffix in (".html", ".charts.json"):
+            stem.with_suffix(suffix).unlink(missing_ok=True)
+        return spec, digest, "empty"
+
+    m, _ = pipeline.build_map(view, map_data, _state['pyramid'], _state['boundaries'], regions=_state['regions'])
+    _write_text(stem.with_suffix(".html"), pipeline.render_map(m))
+
+    import plotly.io as pio
+
+    # Figures and plain figure dicts (the Sankey) serialize the same way
+    charts = build_charts(view, adm2_data, matrix, map_data, row_positions, _state['cube'])
+    charts_json = json.dumps({name: json.loads(pio.to_json(fig)) for name, fig in charts.items()})
+    _write_text(stem.with_suffix(".charts.json"), charts_json)
+    return spec, digest, "rendered"
+
+
+# ====================================================================
+# Runner
+# ====================================================================
+def _read_manifest(output):
+    try:
+        return json.loads((Path(output) / MANIFEST_FILE).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def prerender(output=DEFAULT_OUTPUT, categories=None, provinces=None, modes=(pipeline.TOP_MODE, pipeline.PRODUCT_MODE),
+              workers=None, force=False, source=data_store.SOURCE_PATH, cache_dir=data_store.CACHE_DIR):
+    """
+    Render every requested view into ``output`` on a process pool.
+
+    ``provinces`` defaults to every province in the dataset. Returns the
+    count of views per status.
+    """
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+
+    # Build the shared caches once so workers only read them
+    data_store.load_shared_matrix(source, cache_dir)
+    adm2_data = data_store.load_columns([], source, cache_dir)
+    if provinces is None:
+        provinces = sorted(data_store.province_row_index(adm2_data)) if 'Province' in adm2_data.columns else []
+    base_digest = hashlib.sha256((code_digest() + geometry_digest(adm2_data.geometry.values)).encode("ascii")).hexdigest()
+    del adm2_data
+
+    specs = list(view_specs(provinces, categories, modes))
+    manifest = _read_manifest(output)
+    counts = {"rendered": 0, "skipped": 0, "empty": 0, "failed": 0}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(source, cache_dir)) as pool:
+        futures = [
+            pool.submit(render_view, spec, output, base_digest, manifest.get(str(artifact_stem(spec))), force)
+            for spec in specs
+        ]
+        for done, future in enumerate(as_completed(futures), start=1):
+            spec, digest, status = future.result()
+            if digest is None:
+                manifest.pop(str(artifact_stem(spec)), None)
+            else:
+                manifest[str(artifact_stem(spec))] = digest
+            counts[status] += 1
+            if done % 100 == 0 or done == len(specs):
+                print(f"  {done}/{len(specs)} views ({counts['rendered']} rendered, {counts['skipped']} unchanged)", flush=True)
+
+    _write_text(output / MANIFEST_FILE, json.dumps(manifest, indent=2, sort_keys=True))
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-render every category x product x province view to static files.")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT, help="output directory")
+    parser.add_argument("--categories", nargs="+", choices=list(CATEGORIES), help="categories to render (default: all)")
+    parser.add_argument("--provinces", nargs="+", help="provinces to render besides All Canada (default: all)")
+    parser.add_argument("--top-only", action="store_true", help="render only the top-product views")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--force", action="store_true", help="re-render views even when unchanged")
+    args = parser.parse_args(argv)
+
+    modes = (pipeline.TOP_MODE,) if args.top_only else (pipeline.TOP_MODE, pipeline.PRODUCT_MODE)
+    start = time.perf_counter()
+    counts = prerender(args.output, args.categories, args.provinces, modes, args.workers, args.force)
+    print(
+        f"Rendered {counts['rendered']} views, skipped {counts['skipped']} unchanged and "
+        f"{counts['empty']} empty in {time.perf_counter() - start:.1f}s to {args.output}"
+    )
+    if counts['failed']:
+        print(f"{counts['failed']} views failed; re-run to retry them", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Dense region x product matrix built from ``CATEGORY_PRODUCTS``.
+
+Every product column is coerced to numbers once and packed into a
+contiguous float32 array, with lookups from product code and dataset
+column to matrix column and a column range per category. Per-product
+filtering, totals and rankings all run against this one structure.
+"""
+import numpy as np
+import pandas as pd
+
+from catalog import CATEGORY_PRODUCTS, product_column
+
+
+class ProductMatrix:
+    """Regions x products value matrix; rows are dataset row positions."""
+
+    def __init__(self, values, codes, columns, category_ranges):
+        self.values = values
+        self.codes = codes
+        self.columns = columns
+        self.category_ranges = category_ranges
+        self.code_index = {}
+        for j, code in enumerate(codes):
+            self.code_index.setdefault(code, j)
+        self.column_index = {column: j for j, column in enumerate(columns)}
+        self._top_k_cache = {}
+
+    @property
+    def n_regions(self):
+        return self.values.shape[0]
+
+    def __contains__(self, code):
+        return code in self.code_index
+
+    def column(self, code):
+        """Values of one product for every region (a view, not a copy)."""
+        return self.values[:, self.code_index[code]]
+
+    def category(self, category):
+        """Values of every product in ``category`` as a ``(regions, products)`` view."""
+        start, stop = self.category_ranges[category]
+        return self.values[:, start:stop]
+
+    def category_codes(self, category):
+        start, stop = self.category_ranges[category]
+        return self.codes[start:stop]
+
+    def producing_rows(self, code, positions=None):
+        """Row positions (within ``positions``, if given) with a positive value for ``code``."""
+        values = self.column(code)
+        if positions is None:
+            return np.flatnonzero(values > 0)
+        return positions[values[positions] > 0]
+
+    def top_regions(self, code, positions=None, k=10):
+        """Row positions of the ``k`` largest values of ``code``, largest first."""
+        values = self.column(code)
+        if positions is None:
+            positions = np.arange(self.n_regions)
+        subset = values[positions]
+        k = min(k, len(subset))
+        if k == 0:
+            return positions[:0]
+        top = np.argpartition(-subset, k - 1)[:k]
+        top = top[np.argsort(-subset[top], kind="stable")]
+        return positions[top]
+
+    def top_k(self, codes, k=1):
+        """
+        Top ``k`` products per region among ``codes``, largest first.
+
+        Returns ``(top_codes, top_values)``, both shaped ``(regions, k)``.
+        Regions with fewer than ``k`` producing products get ``None`` codes
+        and zero values in the remaining slots. Results are memoized per
+        product subset and ``k``.
+        """
+        subset = tuple(code for code in dict.fromkeys(codes) if code in self.code_index)
+        key = (subset, k)
+        if key not in self._top_k_cache:
+            self._top_k_cache[key] = self._compute_top_k(subset, k)
+        return self._top_k_cache[key]
+
+    def _compute_top_k(self, subset, k):
+        n = self.n_regions
+        if not subset:
+            return np.full((n, k), None, dtype=object), np.zeros((n, k), dtype=np.float32)
+
+        indices = np.fromiter((self.code_index[c] for c in subset), dtype=np.intp, count=len(subset))
+        values = self.values[:, indices]
+        kk = min(k, len(subset))
+
+        # Unordered top-kk per row, then sort just those kk columns
+        if kk < len(subset):
+            part = np.argpartition(-values, kk - 1, axis=1)[:, :kk]
+        else:
+            part = np.broadcast_to(np.arange(len(subset)), (n, kk))
+        part_values = np.take_along_axis(values, part, axis=1)
+        order = np.argsort(-part_values, axis=1, kind="stable")
+        top_local = np.take_along_axis(part, order, axis=1)
+        top_values = np.take_along_axis(part_values, order, axis=1)
+
+        top_codes = np.asarray(subset, dtype=object)[top_local]
+        top_codes[top_values <= 0] = None
+
+        if kk < k:
+            top_codes = np.hstack([top_codes, np.full((n, k - kk), None, dtype=object)])
+            top_values = np.hstack([top_values, np.zeros((n, k - kk), dtype=np.float32)])
+        return top_codes, top_values
+
+
+def build_product_matrix(frame, category_products=CATEGORY_PRODUCTS):
+    """
+    Pack every product column present in ``frame`` into a ``ProductMatrix``.
+
+    Categories are laid out as contiguous column ranges in
+    ``category_products`` order. Products whose column is missing from
+    ``frame`` are skipped.
+    """
+    codes, columns, category_ranges = [], [], {}
+    for category, products in category_products.items():
+        start = len(codes)
+        for code in products:
+            column = product_column(category, code)
+            if column in frame.columns:
+                codes.append(code)
+                columns.append(column)
+        category_ranges[category] = (start, len(codes))
+
+    values = np.zeros((len(frame), len(columns)), dtype=np.float32, order="C")
+    for j, column in enumerate(columns):
+        values[:, j] = pd.to_numeric(frame[column], errors="coerce").fillna(0).to_numpy(dtype=np.float32)
+
+    return ProductMatrix(values, codes, columns, category_ranges)
+
+
+def matrix_columns(category_products=CATEGORY_PRODUCTS):
+    """Every dataset column the matrix may draw from."""
+    return [product_column(category, code) for category, products in category_products.items() for code in products]
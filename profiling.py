@@ -0,0 +1,134 @@
+"""
+Opt-in per-section timing for the Streamlit page.
+
+Enabled with ``ATLAS_PROFILE=1`` or the ``?profile=1`` query parameter.
+Each rerun records the wall time of every page section; the totals are
+shown in a sidebar debug panel and appended as one JSON line per rerun
+(or fragment rerun) to ``ATLAS_PROFILE_LOG`` for offline analysis.
+When disabled, every timer is a no-op.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+DEFAULT_LOG_PATH = Path(os.environ.get("ATLAS_PROFILE_LOG", "logs/atlas_profile.jsonl"))
+
+_TRUE_VALUES = ("1", "true", "yes", "on")
+_log_lock = threading.Lock()
+
+
+def profiling_requested(query_value=None):
+    """True when the environment variable or the query parameter asks for profiling."""
+    if os.environ.get("ATLAS_PROFILE", "").lower() in _TRUE_VALUES:
+        return True
+    return str(query_value).lower() in _TRUE_VALUES
+
+
+def append_record(record, log_path=DEFAULT_LOG_PATH):
+    """Append one JSON line to the profile log."""
+    log_path = Path(log_path)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    line = json.dumps(record, default=str, ensure_ascii=False)
+    with _log_lock, open(log_path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+class Profiler:
+    """
+    Section timer for one script run.
+
+    Top-level code marks consecutive stages with ``lap``; nested code such
+    as fragments wraps sections in ``section``. ``finish`` logs the rerun;
+    functions decorated with ``fragment`` are logged again whenever they
+    rerun on their own afterwards.
+    """
+
+    def __init__(self, enabled=False, log_path=DEFAULT_LOG_PATH):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.timings = {}
+        self.context = {}
+        self.finished = False
+        self._started = time.perf_counter()
+        self._last_lap = self._started
+
+    def lap(self, name):
+        """Record the time since the previous lap (or the start of the run) as ``name``."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.timings[name] = now - self._last_lap
+        self._last_lap = now
+
+    @contextmanager
+    def section(self, name):
+        """Time the enclosed block as ``name``."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.timings[name] = end - start
+            self._last_lap = end
+
+    def fragment(self, name):
+        """
+        Decorator for fragment functions.
+
+        During the full script run the fragment's sections are part of the
+        rerun record; when the fragment later reruns on its own, its
+        sections are logged as a separate record.
+        """
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or not self.finished:
+                    return func(*args, **kwargs)
+                before = dict(self.timings)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    total = time.perf_counter() - start
+                    sections = {k: v for k, v in self.timings.items() if before.get(k) != v}
+                    self._log("fragment", total, sections, fragment=name)
+            return wrapper
+        return decorate
+
+    def total(self):
+        return time.perf_counter() - self._started
+
+    def finish(self, **context):
+        """Log the full rerun with its view ``context`` (category, mode, provinces, ...)."""
+        if not self.enabled or self.finished:
+            return
+        self.context = context
+        self.finished = True
+        self._log("rerun", self.total(), dict(self.timings))
+
+    def _log(self, kind, total, sections, **extra):
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "kind": kind,
+            **extra,
+            "context": self.context,
+            "total_ms": round(total * 1000, 2),
+            "sections_ms": {name: round(seconds * 1000, 2) for name, seconds in sections.items()},
+        }
+        try:
+            append_record(record, self.log_path)
+        except OSError:
+            # Profiling must never break the page
+            pass
+
+    def rows(self):
+        """``(section, milliseconds)`` pairs in recording order, for display."""
+        return [(name, seconds * 1000) for name, seconds in self.timings.items()]
@@ -0,0 +1,88 @@
+"""
+Per-region and per-province centroids, bounds and land areas.
+
+Built once at load from the region polygons: areas and centroids are
+computed in an equal-area projection (so they are true km² and true
+centroids rather than degree-space approximations), bounds stay in
+longitude/latitude for map fitting. Reruns read these small arrays
+instead of touching geometry, both to frame the map on a selection and
+to turn production values into per-km² densities.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+import shapely
+
+# Canada Albers Equal Area Conic
+EQUAL_AREA_CRS = "ESRI:102001"
+GEOGRAPHIC_CRS = "EPSG:4326"
+
+COLUMNS = ["lon", "lat", "minx", "miny", "maxx", "maxy", "area_km2"]
+
+
+def bounds_center(bounds):
+    """``(lat, lon)`` a web-mercator map centers on to show ``(minx, miny, maxx, maxy)``."""
+    minx, miny, maxx, maxy = bounds
+
+    # Midpoint in mercator units, not degrees, so the extent fits vertically
+    def merc(lat):
+        lat = max(min(lat, 85.0), -85.0)
+        return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+    y = (merc(miny) + merc(maxy)) / 2
+    return math.degrees(2 * math.atan(math.exp(y)) - math.pi / 2), (minx + maxx) / 2
+
+
+class RegionTable:
+    """Centroids, bounds and areas of every region and province, keyed by row position and province."""
+
+    def __init__(self, geoseries, province_index=None):
+        import geopandas as gpd
+        from pyproj import Transformer
+
+        geometries = geoseries.values
+        crs = geoseries.crs or GEOGRAPHIC_CRS
+        projected = gpd.GeoSeries(geometries, crs=crs).to_crs(EQUAL_AREA_CRS).values
+
+        # Equal-area areas and centroids; centroids go back to lon/lat
+        area = shapely.area(projected)
+        xy = shapely.get_coordinates(shapely.centroid(projected))
+        to_geographic = Transformer.from_crs(EQUAL_AREA_CRS, GEOGRAPHIC_CRS, always_xy=True)
+        lon, lat = to_geographic.transform(xy[:, 0], xy[:, 1])
+
+        self.regions = pd.DataFrame(
+            np.column_stack([lon, lat, shapely.bounds(geometries), area / 1e6]),
+            columns=COLUMNS,
+        )
+
+        # Provinces: union of bounds, summed area, area-weighted centroid
+        rows = []
+        for province, positions in (province_index or {}).items():
+            weights = area[positions]
+            if len(positions) == 0 or weights.sum() <= 0:
+                continue
+            x, y = np.average(xy[positions], axis=0, weights=weights)
+            plon, plat = to_geographic.transform(x, y)
+            bounds = self.regions[["minx", "miny", "maxx", "maxy"]].to_numpy()[positions]
+            rows.append([province, plon, plat, *bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0), weights.sum() / 1e6])
+        self.provinces = pd.DataFrame(rows, columns=["Province"] + COLUMNS).set_index("Province")
+
+    def __len__(self):
+        return len(self.regions)
+
+    def province_bounds(self, provinces):
+        """``(minx, miny, maxx, maxy)`` covering ``provinces``, or ``None`` if none are known."""
+        extents = self.provinces.loc[self.provinces.index.intersection(provinces), ["minx", "miny", "maxx", "maxy"]]
+        if extents.empty:
+            return None
+        return (*extents[["minx", "miny"]].min().tolist(), *extents[["maxx", "maxy"]].max().tolist())
+
+    def area_km2(self, positions=None):
+        """Land area in km² of the regions at ``positions`` (all by default)."""
+        area = self.regions["area_km2"].to_numpy()
+        return area if positions is None else area[positions]
+
+    def province_area_km2(self, provinces):
+        """Land area in km² of each of ``provinces``, ``NaN`` for unknown ones."""
+        return self.provinces["area_km2"].reindex(provinces).to_numpy()
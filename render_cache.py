@@ -0,0 +1,81 @@
+"""
+LRU cache for built maps, bounded by an estimated size.
+
+Entries are the built folium ``Map`` objects themselves (with their build
+info), keyed by the view state that determines the map (category, mode,
+product, provinces, display toggles), so a hit skips building the layers
+but the page is still rendered on every rerun. The size of an entry is an
+estimate supplied by the caller, not measured memory; entries are evicted
+least recently used first once the summed estimates exceed the budget.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = int(float(os.environ.get("ATLAS_RENDER_CACHE_MB", "256")) * 1024 * 1024)
+
+
+class RenderCache:
+    """Thread-safe LRU cache bounded by the summed size estimates of its entries."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """Membership test that does not count as a hit or miss."""
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        """Return the cached value for ``key`` (marking it recently used), or ``None``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        """Store ``value`` with an estimated ``size`` in bytes, evicting older entries to stay within budget."""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """Counters for display and logging."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
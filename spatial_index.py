@@ -0,0 +1,39 @@
+"""
+Spatial lookups over the ADM2 polygons.
+
+An STRtree over the region geometries narrows a query to the few
+regions whose bounding boxes match; point lookups then run the exact
+test against prepared polygons, while viewport queries stop at the
+bounding boxes. Results are dataset row positions, so they index
+the shared frame and the product matrix directly.
+"""
+import numpy as np
+import shapely
+
+
+class RegionIndex:
+    """Point-in-polygon lookups over region geometries, built once and shared."""
+
+    def __init__(self, geometries):
+        self.geometries = np.asarray(geometries, dtype=object)
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+
+        # Longest bounding-box side of each region, in degrees
+        bounds = shapely.bounds(self.geometries)
+        self.extents = np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1])
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def locate(self, lon, lat):
+        """Row position of the region containing ``(lon, lat)``, or ``None``."""
+        candidates = self.tree.query(shapely.points(lon, lat))
+        if len(candidates) == 0:
+            return None
+        hits = candidates[shapely.contains_xy(self.geometries[candidates], lon, lat)]
+        return int(hits.min()) if len(hits) else None
+
+    def query_bounds(self, bounds):
+        """Sorted row positions of regions whose bounding boxes meet ``(minx, miny, maxx, maxy)``."""
+        return np.sort(self.tree.query(shapely.box(*bounds)))
@@ -0,0 +1,88 @@
+"""
+Vectorized fill-color assignment for the map layers.
+
+Colors are computed for every region in one pass and stored as a
+column, so the per-feature style function only reads a property.
+"""
+import numpy as np
+import pandas as pd
+
+MISSING_COLOR = "#888888"
+ZERO_COLOR = "#cccccc"
+
+_HEX_BYTES = np.array([f"{i:02x}" for i in range(256)])
+
+
+def _rgb_to_hex(rgb):
+    """Convert an ``(n, 3)`` array of 0-255 integers to ``'#rrggbb'`` strings."""
+    rgb = np.asarray(rgb, dtype=np.intp)
+    hex_strings = np.char.add(
+        np.char.add(_HEX_BYTES[rgb[:, 0]], _HEX_BYTES[rgb[:, 1]]),
+        _HEX_BYTES[rgb[:, 2]],
+    )
+    return np.char.add("#", hex_strings)
+
+
+def categorical_colors(labels, palette, missing_color=MISSING_COLOR):
+    """
+    Assign palette colors to labels by factorizing them once.
+
+    Returns ``(colors, label_colors)`` where ``colors`` is an array aligned
+    with ``labels`` and ``label_colors`` maps each label to its color in
+    order of first appearance (the legend order).
+    """
+    codes, uniques = pd.factorize(labels, sort=False)
+    palette = np.asarray(list(palette) + [missing_color], dtype=object)
+
+    # Labels beyond the palette length and missing labels fall back to missing_color
+    indices = np.where((codes >= 0) & (codes < len(palette) - 1), codes, len(palette) - 1)
+    colors = palette[indices]
+
+    label_colors = {label: palette[i] for i, label in enumerate(uniques[: len(palette) - 1])}
+    return colors, label_colors
+
+
+def colormap_colors(values, colormap, zero_color=ZERO_COLOR):
+    """
+    Evaluate a branca ``LinearColormap`` for all values with NumPy interpolation.
+
+    Matches ``colormap(value)`` for positive values; zero, negative and
+    missing values get ``zero_color``.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    stops = np.asarray(colormap.index, dtype=np.float64)
+    stop_colors = np.asarray(colormap.colors, dtype=np.float64)[:, :3]
+
+    # Missing values are masked before interpolation so NaN never reaches the integer cast
+    blank = ~(values > 0)
+    clipped = np.clip(np.where(blank, stops[0], values), stops[0], stops[-1])
+    channels = np.column_stack([np.interp(clipped, stops, stop_colors[:, i]) for i in range(3)])
+    rgb = (channels * 255.9999).astype(np.intp)
+
+    colors = _rgb_to_hex(rgb).astype(object)
+    colors[blank] = zero_color
+    return colors
+
+
+def distinct_colors(n, saturation=(0.75, 0.5), value=(0.85, 0.95)):
+    """
+    ``n`` distinguishable ``'#rrggbb'`` colors without a plotting dependency.
+
+    Hues step by the golden ratio so consecutive labels land far apart on
+    the color wheel; saturation and value alternate between two levels.
+    """
+    i = np.arange(n)
+    h = (i * 0.618033988749895) % 1.0
+    s = np.where(i % 2 == 0, saturation[0], saturation[1])
+    v = np.where(i % 2 == 0, value[0], value[1])
+
+    # Vectorized HSV -> RGB
+    h6 = h * 6.0
+    sector = np.floor(h6).astype(np.intp) % 6
+    f = h6 - np.floor(h6)
+    p, q, t = v * (1 - s), v * (1 - s * f), v * (1 - s * (1 - f))
+    channels = np.select(
+        [sector[:, None] == k for k in range(6)],
+        [np.column_stack(c) for c in ((v, t, p), (q, v, p), (p, v, t), (p, q, v), (t, p, v), (v, p, q))],
+    )
+    return _rgb_to_hex((channels * 255.9999).astype(np.intp)).tolist()
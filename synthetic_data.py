@@ -0,0 +1,170 @@
+"""
+Synthetic census-division datasets matching the ADM2 schema.
+
+Generates a gap-free Voronoi tessellation over Canada's extent with
+``shapeName``, ``Province``, ``ADM2_KEY``, every product column in
+``CATEGORY_PRODUCTS`` and the ``top_*``/``top_*_value`` pairs of every
+category. Region counts scale from hundreds to tens of thousands, and
+borders are densified to a realistic number of vertices per region, so
+every code path can be measured at finer geographies than the real
+dataset provides.
+
+    python -m synthetic_data --regions 50000 --output data/synthetic_adm2.geojson
+"""
+import argparse
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from catalog import AGGREGATE_CATEGORIES, CATEGORIES, CATEGORY_PRODUCTS, PRODUCT_LABELS, product_column
+
+EXTENT = (-141.0, 42.0, -52.6, 70.0)
+
+# Approximate (minx, miny, maxx, maxy) extents, checked in order
+PROVINCE_EXTENTS = [
+    ("Prince Edward Island / Île-du-Prince-Édouard", (-64.5, 45.9, -62.0, 47.1)),
+    ("Nova Scotia / Nouvelle-Écosse", (-66.5, 43.3, -59.7, 47.1)),
+    ("New Brunswick / Nouveau-Brunswick", (-69.0, 44.5, -64.0, 48.0)),
+    ("Newfoundland and Labrador / Terre-Neuve-et-Labrador", (-64.0, 46.6, -52.6, 60.4)),
+    ("Yukon", (-141.0, 60.0, -124.0, 70.0)),
+    ("Northwest Territories / Territoires du Nord-Ouest", (-124.0, 60.0, -102.0, 70.0)),
+    ("Nunavut", (-102.0, 60.0, -52.6, 70.0)),
+    ("British Columbia / Colombie-Britannique", (-141.0, 42.0, -120.0, 60.0)),
+    ("Alberta", (-120.0, 42.0, -110.0, 60.0)),
+    ("Saskatchewan", (-110.0, 42.0, -101.5, 60.0)),
+    ("Manitoba", (-101.5, 49.0, -89.0, 60.0)),
+    ("Ontario", (-101.5, 42.0, -79.5, 57.0)),
+    ("Quebec / Québec", (-79.5, 42.0, -52.6, 62.0)),
+]
+
+DEFAULT_REGIONS = 2000
+DEFAULT_VERTICES = 120
+
+# Share of regions producing any given product
+PRODUCING_SHARE = 0.35
+
+
+# ====================================================================
+# Geometry
+# ====================================================================
+def _sample_points(n_regions, rng):
+    """Region seed points, denser in the south where census divisions are smaller."""
+    minx, miny, maxx, maxy = EXTENT
+    x = rng.uniform(minx, maxx, n_regions)
+    y = miny + (maxy - miny) * rng.beta(1.3, 3.0, n_regions)
+    return x, y
+
+
+def assign_provinces(x, y):
+    """Province of each point from ``PROVINCE_EXTENTS`` (first match wins)."""
+    provinces = np.full(len(x), PROVINCE_EXTENTS[-1][0], dtype=object)
+    unassigned = np.ones(len(x), dtype=bool)
+    for name, (minx, miny, maxx, maxy) in PROVINCE_EXTENTS:
+        inside = unassigned & (x >= minx) & (x < maxx) & (y >= miny) & (y < maxy)
+        provinces[inside] = name
+        unassigned &= ~inside
+    return provinces
+
+
+def tessellate(x, y, vertices_per_region=DEFAULT_VERTICES):
+    """
+    Voronoi cells of the points, clipped to ``EXTENT`` and densified.
+
+    Cells are returned in point order. Borders are segmentized with one
+    global segment length, so neighbouring cells keep identical shared
+    edges at the requested average vertex count.
+    """
+    points = shapely.points(x, y)
+    extent = shapely.box(*EXTENT)
+    cells = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(points), extend_to=extent))
+    cells = shapely.intersection(cells, extent)
+
+    # Voronoi output order is unspecified; match each point to its cell
+    tree = shapely.STRtree(cells)
+    point_index, cell_index = tree.query(points, predicate="intersects")
+    first = np.unique(point_index, return_index=True)[1]
+    ordered = np.empty(len(points), dtype=object)
+    ordered[point_index[first]] = cells[cell_index[first]]
+
+    if vertices_per_region:
+        perimeter = np.median(shapely.length(ordered))
+        ordered = shapely.segmentize(ordered, perimeter / vertices_per_region)
+    return ordered
+
+
+# ====================================================================
+# Attributes
+# ====================================================================
+def _product_values(provinces, farmland, rng):
+    """Zero-inflated, province-flavoured production values for every product column."""
+    province_codes, province_names = pd.factorize(provinces)
+    columns = {}
+    for category, products in CATEGORY_PRODUCTS.items():
+        scale = 50.0 if CATEGORIES[category]["unit"] == "count" else 5.0
+        for code in products:
+            # Each province favours some products more than others
+            affinity = rng.lognormal(0.0, 1.0, len(province_names))[province_codes]
+            producing = rng.random(len(provinces)) < PRODUCING_SHARE * np.minimum(affinity, 2.5) / 1.5
+            values = rng.gamma(0.6, scale, len(provinces)) * affinity * farmland
+            columns[product_column(category, code)] = np.where(producing, np.round(values, 1), 0.0)
+    return columns
+
+
+def _top_columns(products):
+    """The ``top_*`` label and value columns of every category."""
+    columns = {}
+    for category, info in CATEGORIES.items():
+        label_col, value_col = info["columns"]
+        members = AGGREGATE_CATEGORIES.get(category, [category])
+        sources = [(product_column(member, code), code) for member in members for code in CATEGORY_PRODUCTS[member]]
+        values = np.column_stack([products[column] for column, _ in sources])
+        best = values.argmax(axis=1)
+        best_values = values[np.arange(len(values)), best]
+        labels = np.asarray([PRODUCT_LABELS[code] for _, code in sources], dtype=object)[best]
+        labels[best_values <= 0] = None
+        columns[label_col] = labels
+        columns[value_col] = best_values
+    return columns
+
+
+def generate(n_regions=DEFAULT_REGIONS, vertices_per_region=DEFAULT_VERTICES, seed=0):
+    """Build a synthetic ADM2 GeoDataFrame with ``n_regions`` polygons in EPSG:4326."""
+    rng = np.random.default_rng(seed)
+    x, y = _sample_points(n_regions, rng)
+    provinces = assign_provinces(x, y)
+    polygons = tessellate(x, y, vertices_per_region)
+
+    # Production scales with land area relative to the typical region and
+    # falls off northwards with the share of farmland
+    areas = shapely.area(polygons)
+    farmland = areas / np.median(areas) * np.exp(-(y - EXTENT[1]) / 4.0)
+
+    products = _product_values(provinces, farmland, rng)
+    attributes = pd.DataFrame({**products, **_top_columns(products)})
+
+    keys = pd.DataFrame({
+        "shapeName": [f"Division {k:05d}" for k in range(n_regions)],
+        "Province": provinces,
+        "ADM2_KEY": [f"SYN-{k:06d}" for k in range(n_regions)],
+    })
+    return gpd.GeoDataFrame(pd.concat([keys, attributes], axis=1), geometry=polygons, crs="EPSG:4326")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic ADM2 agricultural dataset.")
+    parser.add_argument("--regions", type=int, default=DEFAULT_REGIONS, help="number of polygons")
+    parser.add_argument("--vertices", type=int, default=DEFAULT_VERTICES, help="average vertices per polygon")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="output file (.geojson or .gpkg)")
+    args = parser.parse_args(argv)
+
+    gdf = generate(args.regions, args.vertices, args.seed)
+    driver = "GPKG" if args.output.endswith(".gpkg") else "GeoJSON"
+    gdf.to_file(args.output, driver=driver)
+    print(f"Wrote {len(gdf)} regions ({shapely.get_num_coordinates(gdf.geometry.values).sum():,} vertices) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import io
+import json
+
+import geopandas as gpd
+import pandas as pd
+import pytest
+import shapely
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+import export
+
+
+@pytest.fixture
+def frame():
+    return gpd.GeoDataFrame(
+        {"shapeName": ["Div 1", "Div 2", "Div 3"], "Province": ["Manitoba"] * 3, "WHEAT": [1.5, 0.0, 16_777_217.0]},
+        geometry=[shapely.box(i, 50, i + 1, 51) for i in range(3)],
+        crs="EPSG:4326",
+    )
+
+
+@pytest.mark.parametrize("fmt", list(export.EXPORT_FORMATS))
+def test_build_export_is_accepted_by_download_button(frame, fmt):
+    data = export.build_export(frame, fmt, chunk_rows=2)
+
+    data_as_bytes, _ = convert_data_to_bytes_and_infer_mime(data, unsupported_error=TypeError(fmt))
+
+    if fmt == "CSV":
+        decoded = pd.read_csv(io.BytesIO(data_as_bytes))
+        assert decoded["WHEAT"].tolist() == [1.5, 0.0, 16_777_217.0]
+        assert "geometry" not in decoded.columns
+    elif fmt == "GeoJSON":
+        decoded = json.loads(data_as_bytes)
+        assert [f["properties"]["shapeName"] for f in decoded["features"]] == ["Div 1", "Div 2", "Div 3"]
+    else:
+        decoded = gpd.read_parquet(io.BytesIO(data_as_bytes))
+        assert decoded["WHEAT"].tolist() == [1.5, 0.0, 16_777_217.0]
+        assert decoded.geometry.equals(frame.geometry)
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import pipeline
+
+LEVELS = ["Province", "Product", "ADM2_KEY"]
+
+
+@pytest.fixture
+def paths():
+    rng = np.random.default_rng(0)
+    regions = pd.DataFrame({
+        "ADM2_KEY": [f"R{k:03d}" for k in range(60)],
+        # Division names repeat across provinces, as in the real data
+        "shapeName": [f"Division No. {k % 20}" for k in range(60)],
+        "Province": rng.choice(["Alberta", "Saskatchewan", "Manitoba", "Ontario"], 60),
+    })
+    frame = regions.loc[regions.index.repeat(3)].reset_index(drop=True)
+    frame["Product"] = rng.choice(["WHEAT", "CANOLA", "BARLEY", "OATS", "PEAS"], len(frame))
+    frame["Value"] = rng.gamma(2.0, 1000.0, len(frame))
+    return frame
+
+
+def flows(nodes, links):
+    """Inflow and outflow of every node position."""
+    inflow = np.bincount(links["target"], weights=links["value"], minlength=len(nodes))
+    outflow = np.bincount(links["source"], weights=links["value"], minlength=len(nodes))
+    return inflow, outflow
+
+
+@pytest.mark.parametrize("max_links", [3, 8, 1000])
+def test_sankey_links_conserves_totals(paths, max_links):
+    nodes, links = pipeline.sankey_links(paths, LEVELS, "Value", max_links, label_columns={"ADM2_KEY": "shapeName"})
+    inflow, outflow = flows(nodes, links)
+    total = paths["Value"].sum()
+
+    # Nodes are numbered 0..n-1 by level, and links join adjacent levels
+    assert nodes["level"].is_monotonic_increasing
+    assert set(links["source"]) | set(links["target"]) == set(range(len(nodes)))
+    assert (nodes["level"].to_numpy()[links["target"]] == nodes["level"].to_numpy()[links["source"]] + 1).all()
+
+    # The full total crosses between every pair of levels
+    for level in range(len(LEVELS) - 1):
+        assert links.loc[nodes["level"].to_numpy()[links["source"]] == level, "value"].sum() == pytest.approx(total)
+
+    # Every middle node passes on exactly what it receives
+    middle = (nodes["level"] > 0) & (nodes["level"] < len(LEVELS) - 1)
+    np.testing.assert_allclose(inflow[middle], outflow[middle])
+
+    # The first level is never bucketed
+    first = nodes[nodes["level"] == 0]
+    expected = paths.groupby("Province")["Value"].sum()
+    np.testing.assert_allclose(outflow[first.index], expected.reindex(first["label"]).to_numpy())
+
+
+def test_sankey_links_buckets_small_branches_as_other(paths):
+    nodes, links = pipeline.sankey_links(paths, LEVELS, "Value", 3, label_columns={"ADM2_KEY": "shapeName"})
+    inflow, _ = flows(nodes, links)
+
+    for level in range(1, len(LEVELS)):
+        at_level = nodes[nodes["level"] == level]
+        assert (~at_level["other"]).sum() <= 3
+        assert at_level.loc[at_level["other"], "label"].tolist() == [pipeline.SANKEY_OTHER]
+
+    # Once in Other, rows stay in Other
+    other = nodes.index[nodes["other"]]
+    assert links.loc[links["source"].isin(other), "target"].isin(other).all()
+
+    # The kept products carry exactly their rows in the largest branches
+    products = nodes[(nodes["level"] == 1) & ~nodes["other"]]
+    branch_totals = paths.groupby(["Province", "Product"])["Value"].sum().nlargest(3)
+    kept = branch_totals.groupby(level="Product").sum()
+    np.testing.assert_allclose(inflow[products.index], kept.reindex(products["label"]).to_numpy())
+
+
+def test_sankey_links_keeps_regions_that_share_a_name(paths):
+    nodes, links = pipeline.sankey_links(paths, LEVELS, "Value", 1000, label_columns={"ADM2_KEY": "shapeName"})
+    inflow, _ = flows(nodes, links)
+
+    regions = nodes[nodes["level"] == 2]
+    assert len(regions) == paths["ADM2_KEY"].nunique()
+    expected = paths.groupby("ADM2_KEY", sort=False)["Value"].sum()
+    names = paths.drop_duplicates("ADM2_KEY").set_index("ADM2_KEY")["shapeName"]
+    assert regions["label"].tolist() == names.reindex(expected.index).tolist()
+    np.testing.assert_allclose(inflow[regions.index], expected.to_numpy())
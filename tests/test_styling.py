@@ -0,0 +1,15 @@
+import branca.colormap as cm
+import numpy as np
+
+import styling
+
+
+def test_colormap_colors_matches_branca_and_blanks_missing_values():
+    colormap = cm.LinearColormap(colors=["#ffffe5", "#fe9929", "#662506"], vmin=0.0, vmax=100.0)
+    values = np.array([np.nan, 0.0, -5.0, 10.0, 55.5, 100.0, 250.0])
+
+    colors = styling.colormap_colors(values, colormap)
+
+    assert colors[:3].tolist() == [styling.ZERO_COLOR] * 3
+    for value, color in zip(values[3:], colors[3:]):
+        assert color == colormap(min(value, 100.0))[:7]
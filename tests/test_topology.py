@@ -0,0 +1,91 @@
+import json
+import math
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+import data_store
+import synthetic_data
+import topology
+
+
+def decode(encoded):
+    """Polygons and property columns of an encoded topology, as topojson-client would rebuild them."""
+    topo = json.loads(encoded)
+    (sx, sy), (tx, ty) = topo["transform"]["scale"], topo["transform"]["translate"]
+    arcs = [np.cumsum(np.array(arc, dtype=float), axis=0) * [sx, sy] + [tx, ty] for arc in topo["arcs"]]
+
+    def ring(refs):
+        points = []
+        for ref in refs:
+            arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+            points.extend(arc.tolist() if not points else arc[1:].tolist())
+        return points
+
+    def polygon(rings):
+        return shapely.Polygon(ring(rings[0]), [ring(hole) for hole in rings[1:]])
+
+    geometries = []
+    for geometry in topo["objects"][topology.OBJECT_NAME]["geometries"]:
+        if geometry["type"] == "Polygon":
+            geometries.append(polygon(geometry["arcs"]))
+        else:
+            geometries.append(shapely.MultiPolygon([polygon(rings) for rings in geometry["arcs"]]))
+
+    columns = {}
+    for name, column in topo["columns"].items():
+        if "categories" in column:
+            columns[name] = [column["categories"][code] if code >= 0 else None for code in column["codes"]]
+        else:
+            columns[name] = column["values"]
+    return geometries, columns
+
+
+def assert_round_trip(gdf, step):
+    geometries, columns = decode(topology.encode(gdf, ["shapeName", "Province"], step))
+
+    assert len(geometries) == len(gdf)
+    assert columns["shapeName"] == gdf["shapeName"].tolist()
+    assert columns["Province"] == gdf["Province"].tolist()
+    # Every vertex moves to its nearest grid point, at most half a diagonal away
+    distances = shapely.hausdorff_distance(np.array(geometries, dtype=object), gdf.geometry.values)
+    assert distances.max() <= step * math.sqrt(2) / 2 + 1e-9
+
+
+@pytest.fixture(scope="module")
+def synthetic():
+    gdf = synthetic_data.generate(200, vertices_per_region=60, seed=0)
+    # A hole and a second part, so holes and MultiPolygons are covered too
+    first = gdf.geometry.iloc[0]
+    gdf.loc[0, "geometry"] = first.difference(first.centroid.buffer(0.05))
+    gdf.loc[1, "geometry"] = shapely.MultiPolygon([gdf.geometry.iloc[1], shapely.box(-50.0, 40.0, -49.5, 40.5)])
+    return gdf
+
+
+@pytest.mark.parametrize("step", [topology.FULL_RESOLUTION_STEP, 0.0025, 0.01])
+def test_encode_decodes_within_the_quantization_step(synthetic, step):
+    assert_round_trip(synthetic, step)
+
+
+def test_encode_stores_shared_borders_once():
+    gdf = gpd.GeoDataFrame(
+        {"shapeName": ["West", "East"], "Province": ["Manitoba"] * 2},
+        geometry=[shapely.box(0, 0, 1, 1), shapely.box(1, 0, 2, 1)],
+        crs="EPSG:4326",
+    )
+
+    topo = json.loads(topology.encode(gdf, ["shapeName"], 0.5))
+
+    # The shared edge, then each box's remaining outline
+    assert len(topo["arcs"]) == 3
+    west, east = (g["arcs"][0] for g in topo["objects"][topology.OBJECT_NAME]["geometries"])
+    assert {ref if ref >= 0 else ~ref for ref in west} & {ref if ref >= 0 else ~ref for ref in east}
+    assert_round_trip(gdf, 0.5)
+
+
+@pytest.mark.skipif(not data_store.SOURCE_PATH.exists(), reason="bundled dataset not present")
+def test_encode_round_trips_the_bundled_data():
+    gdf = gpd.read_file(data_store.SOURCE_PATH, columns=["shapeName", "Province"])
+    assert_round_trip(gdf, topology.FULL_RESOLUTION_STEP)
@@ -0,0 +1,274 @@
+"""
+Local vector-tile (MVT) serving mode for the choropleth.
+
+ADM2 geometries are cut into Mapbox Vector Tiles on first request and
+cached on disk, then served from a small in-process HTTP endpoint.
+In tile mode the page only carries per-region colors and tooltip
+labels; geometry is fetched by the browser one viewport tile at a
+time and never re-sent when the category or product changes.
+
+Requires the optional ``mapbox-vector-tile`` package.
+"""
+import html
+import importlib.util
+import json
+import math
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+from branca.element import MacroElement
+from folium.plugins import VectorGridProtobuf
+from jinja2 import Template
+
+import data_store
+import geometry
+
+TILE_CACHE_DIR = data_store.CACHE_DIR / "tiles"
+LAYER_NAME = "adm2"
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_TILE_ZOOM = 12
+
+# Address the tile server binds to, and the URL template the browser uses.
+# Override ATLAS_TILE_URL when the app sits behind a proxy.
+TILE_HOST = os.environ.get("ATLAS_TILE_HOST", "127.0.0.1")
+TILE_PORT = int(os.environ.get("ATLAS_TILE_PORT", "8765"))
+TILE_URL = os.environ.get("ATLAS_TILE_URL", f"http://localhost:{TILE_PORT}/tiles/{{z}}/{{x}}/{{y}}.pbf")
+
+WEB_MERCATOR_HALF = math.pi * 6378137.0
+
+_TILE_PATH = re.compile(r"^/tiles/(\d+)/(\d+)/(\d+)\.pbf$")
+
+
+def available():
+    """Whether the optional MVT encoder is installed."""
+    return importlib.util.find_spec("mapbox_vector_tile") is not None
+
+
+def _encode_tile(features, bounds):
+    """Encode features into MVT bytes, supporting mapbox-vector-tile 1.x and 2.x."""
+    import mapbox_vector_tile
+
+    layers = [{"name": LAYER_NAME, "features": features}]
+    try:
+        return mapbox_vector_tile.encode(
+            layers,
+            default_options={"quantize_bounds": bounds, "extents": TILE_EXTENT},
+        )
+    except TypeError:
+        return mapbox_vector_tile.encode(layers, quantize_bounds=bounds, extents=TILE_EXTENT)
+
+
+def tile_bounds(z, x, y):
+    """Web-mercator bounds ``(minx, miny, maxx, maxy)`` of tile ``z/x/y``."""
+    size = 2 * WEB_MERCATOR_HALF / (2 ** z)
+    minx = -WEB_MERCATOR_HALF + x * size
+    maxy = WEB_MERCATOR_HALF - y * size
+    return (minx, maxy - size, minx + size, maxy)
+
+
+# ====================================================================
+# Tile Source
+# ====================================================================
+class TileSource:
+    """Cuts and caches vector tiles from a geometry pyramid (see ``geometry.build_geometry_pyramid``)."""
+
+    def __init__(self, pyramid, cache_dir=TILE_CACHE_DIR):
+        fingerprint = data_store.source_fingerprint()
+        self.cache_dir = Path(cache_dir) / f"{fingerprint['mtime_ns']}-{fingerprint['size']}"
+        self._pyramid = pyramid
+        self._projected = {}
+        self._lock = threading.Lock()
+
+    def _level(self, z):
+        """Projected geometry and spatial index for the pyramid level used at zoom ``z``."""
+        level = geometry.select_level(self._pyramid, z)
+        with self._lock:
+            if level not in self._projected:
+                projected = self._pyramid[level].to_crs("EPSG:3857")
+                self._projected[level] = (projected, shapely.STRtree(projected.values))
+            return self._projected[level]
+
+    def cut(self, z, x, y):
+        """Build the MVT bytes for tile ``z/x/y``."""
+        projected, tree = self._level(z)
+        bounds = tile_bounds(z, x, y)
+        pad = (bounds[2] - bounds[0]) * TILE_BUFFER / TILE_EXTENT
+        clip_box = (bounds[0] - pad, bounds[1] - pad, bounds[2] + pad, bounds[3] + pad)
+
+        positions = tree.query(shapely.box(*clip_box), predicate="intersects")
+        clipped = shapely.clip_by_rect(projected.values[positions], *clip_box)
+        features = [
+            {"geometry": geom, "properties": {"rid": int(projected.index[pos])}}
+            for pos, geom in zip(positions, clipped)
+            if not geom.is_empty
+        ]
+        return _encode_tile(features, bounds)
+
+    def get(self, z, x, y):
+        """Return tile bytes from the disk cache, cutting the tile on a miss."""
+        path = self.cache_dir / str(z) / str(x) / f"{y}.pbf"
+        if path.exists():
+            return path.read_bytes()
+
+        data = self.cut(z, x, y)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        return data
+
+
+# ====================================================================
+# Tile Server
+# ====================================================================
+def start_tile_server(source, host=TILE_HOST, port=TILE_PORT):
+    """Serve ``/tiles/{z}/{x}/{y}.pbf`` from ``source`` on a daemon thread."""
+
+    class TileHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            match = _TILE_PATH.match(self.path.split("?", 1)[0])
+            if not match:
+                self.send_error(404)
+                return
+            z, x, y = (int(v) for v in match.groups())
+            if z > MAX_TILE_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+                self.send_error(404)
+                return
+
+            data = source.get(z, x, y)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-protobuf")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Cache-Control", "public, max-age=86400")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), TileHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="atlas-tile-server", daemon=True).start()
+    return server
+
+
+# ====================================================================
+# Map Layer
+# ====================================================================
+class _VectorTileHover(MacroElement):
+    """Highlights a hovered vector-tile region and shows its tooltip label."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var layer = {{ this.layer.get_name() }}, map = {{ this.map.get_name() }};
+            var labels = {{ this.labels }};
+            var tooltip = null;
+            layer.on('mouseover', function(e) {
+                var rid = e.layer.properties.rid;
+                var style = layer.options.atlasPaint(rid, true);
+                if (style) { layer.setFeatureStyle(rid, style); }
+                var label = labels ? labels[rid] : undefined;
+                if (label === undefined || label === '') { return; }
+                tooltip = map.openTooltip(label, e.latlng);
+            });
+            layer.on('mouseout', function(e) {
+                layer.resetFeatureStyle(e.layer.properties.rid);
+                if (tooltip) { map.closeTooltip(tooltip); tooltip = null; }
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, layer, map_, labels):
+        super().__init__()
+        self._name = "VectorTileHover"
+        self.layer = layer
+        self.map = map_
+        self.labels = json.dumps(labels)
+
+
+def tooltip_labels(gdf, fields, aliases, requires=None):
+    """
+    Pre-render tooltip HTML for every region, one column at a time.
+
+    Rows whose value is missing are left out, as are rows whose field maps
+    in ``requires`` to another field that is missing (e.g. a rank's value
+    when the region has no product at that rank).
+    """
+    requires = requires or {}
+    label = np.full(len(gdf), "", dtype=object)
+    for field, alias in zip(fields, aliases):
+        column = gdf[field]
+        missing = column.isna().to_numpy()
+        if field in requires:
+            missing = missing | gdf[requires[field]].isna().to_numpy()
+        if pd.api.types.is_numeric_dtype(column):
+            text = column.fillna(0).map("{:,.0f}".format)
+        else:
+            text = column.fillna("").astype(str).map(html.escape)
+        part = np.where(missing, "", f"<b>{html.escape(alias)}</b> " + text.to_numpy(dtype=object))
+        label = label + np.where((label != "") & (part != ""), "<br>", "") + part
+    return pd.Series(label, index=gdf.index, dtype=object)
+
+
+def region_attributes(gdf, fill_colors, labels=None):
+    """Build the per-region ``{rid: value}`` lookups embedded in the page."""
+    rids = [int(i) for i in gdf.index]
+    colors = dict(zip(rids, fill_colors))
+    return colors, (dict(zip(rids, labels)) if labels is not None else None)
+
+
+def add_vector_tile_layer(m, colors, style, highlight, labels=None, url=TILE_URL, name="Agricultural Products"):
+    """
+    Add the ADM2 vector-tile layer to ``m``, styled from ``{rid: color}``.
+
+    ``style`` and ``highlight`` are the ``(base, color_keys)`` specs of
+    ``pipeline.style_layer``, so tiles look like the embedded layer.
+    Regions missing from ``colors`` are drawn invisibly. Returns the number
+    of attribute bytes embedded in the page.
+    """
+    colors_json = json.dumps(colors)
+    options = """(function() {
+        var colors = %s;
+        var paint = function(spec, c) {
+            var s = Object.assign({fill: true}, spec[0]);
+            spec[1].forEach(function(k) { s[k] = c; });
+            return s;
+        };
+        var style = %s, highlight = %s;
+        return {
+            interactive: true,
+            maxNativeZoom: %d,
+            getFeatureId: function(f) { return f.properties.rid; },
+            atlasPaint: function(rid, hovered) {
+                var c = colors[rid];
+                return c === undefined ? null : Object.assign(paint(style, c), hovered ? paint(highlight, c) : {});
+            },
+            vectorTileLayerStyles: {
+                %s: function(properties) {
+                    var c = colors[properties.rid];
+                    if (c === undefined) { return {fill: false, stroke: false, weight: 0}; }
+                    return paint(style, c);
+                }
+            }
+        };
+    })()""" % (colors_json, json.dumps(style), json.dumps(highlight), MAX_TILE_ZOOM, LAYER_NAME)
+
+    layer = VectorGridProtobuf(url, name, options)
+    layer.add_to(m)
+    attribute_bytes = len(colors_json.encode("utf-8"))
+
+    hover = _VectorTileHover(layer, m, labels)
+    m.add_child(hover)
+    if labels is not None:
+        attribute_bytes += len(hover.labels.encode("utf-8"))
+    return attribute_bytes
@@ -0,0 +1,302 @@
+"""
+TopoJSON encoding for the map layers.
+
+Neighbouring census divisions share every border vertex, so a GeoJSON
+layer sends each shared edge twice. The encoder here snaps coordinates
+to an integer grid whose step depends on the zoom being drawn, cuts
+every ring at the junctions where borders meet, stores each distinct arc
+once (delta-encoded), and has polygons reference arcs by index.
+Feature properties travel as one column table (``columns``, a foreign
+member of the topology) with repeated strings dictionary-encoded. The
+browser decodes the topology back to GeoJSON with ``topojson-client``
+and attaches each feature's properties from the table.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+import shapely
+from folium.elements import JSCSSMixin
+from folium.map import Layer
+from jinja2 import Template
+
+# Grid step (degrees) for each level, keyed by the highest zoom it is used
+# for, about a tenth of a pixel. Zooms above the last key use the full step.
+QUANTIZATION_STEPS = {
+    4: 0.01,
+    5: 0.005,
+    6: 0.0025,
+    8: 0.0005,
+}
+FULL_RESOLUTION_STEP = 0.00001
+
+OBJECT_NAME = "layer"
+
+
+def quantization_step(zoom, steps=QUANTIZATION_STEPS):
+    """Grid step in degrees for a layer drawn at ``zoom``."""
+    for max_zoom in sorted(steps):
+        if zoom <= max_zoom:
+            return steps[max_zoom]
+    return FULL_RESOLUTION_STEP
+
+
+# ====================================================================
+# Encoding
+# ====================================================================
+def _quantized_rings(geometries, step):
+    """
+    Rings of every polygon as quantized point keys.
+
+    Returns ``(keys, starts, ends, ring_polygon, polygon_feature, width,
+    translate)``: ring ``r`` is ``keys[starts[r]:ends[r]]`` without its
+    closing point, a key decodes to grid coordinates with
+    ``divmod(key, width)``, and ``translate`` is the grid origin.
+    """
+    polygons, polygon_feature = shapely.get_parts(geometries, return_index=True)
+    rings, ring_polygon = shapely.get_rings(polygons, return_index=True)
+    coords, point_ring = shapely.get_coordinates(rings, return_index=True)
+
+    translate = coords.min(axis=0) if len(coords) else np.zeros(2)
+    grid = np.round((coords - translate) / step).astype(np.int64)
+    width = int(grid[:, 1].max()) + 1 if len(grid) else 1
+    keys = grid[:, 0] * width + grid[:, 1]
+
+    # Drop closing points and points that collapse onto their predecessor
+    last = np.r_[point_ring[1:] != point_ring[:-1], True]
+    repeat = np.r_[False, (keys[1:] == keys[:-1]) & (point_ring[1:] == point_ring[:-1])]
+    keep = ~last & ~repeat
+    keys, point_ring = keys[keep], point_ring[keep]
+
+    # A ring's last point may also have collapsed onto its first
+    ring_ids = np.arange(len(rings))
+    starts = np.searchsorted(point_ring, ring_ids)
+    ends = np.searchsorted(point_ring, ring_ids, side="right")
+    wraps = (ends - starts > 1) & (keys[np.minimum(ends - 1, len(keys) - 1)] == keys[np.minimum(starts, len(keys) - 1)])
+    if wraps.any():
+        keep = np.ones(len(keys), dtype=bool)
+        keep[ends[wraps] - 1] = False
+        keys, point_ring = keys[keep], point_ring[keep]
+        starts = np.searchsorted(point_ring, ring_ids)
+        ends = np.searchsorted(point_ring, ring_ids, side="right")
+    return keys, starts, ends, ring_polygon, polygon_feature, width, translate
+
+
+def _junctions(keys, starts, ends, valid):
+    """
+    Mask of points where borders meet.
+
+    A point is a junction when it is reached from more than one distinct
+    pair of neighbours, i.e. where a shared border starts or ends.
+    """
+    n = len(keys)
+    ring_of = np.repeat(np.arange(len(starts)), ends - starts)
+    position = np.arange(n)
+    prev_index = np.where(position == starts[ring_of], ends[ring_of] - 1, position - 1)
+    next_index = np.where(position == ends[ring_of] - 1, starts[ring_of], position + 1)
+    prev_keys, next_keys = keys[prev_index], keys[next_index]
+    low, high = np.minimum(prev_keys, next_keys), np.maximum(prev_keys, next_keys)
+
+    in_valid = valid[ring_of]
+    neighbours = np.unique(np.column_stack([keys, low, high])[in_valid], axis=0)
+    point_keys, counts = np.unique(neighbours[:, 0], return_counts=True)
+    return np.isin(keys, point_keys[counts > 1])
+
+
+def encode(gdf, fields, quantization=FULL_RESOLUTION_STEP):
+    """
+    Encode ``gdf`` as a TopoJSON string with one ``GeometryCollection``.
+
+    ``fields`` are copied into each geometry's properties (columns missing
+    from ``gdf`` are skipped). Coordinates are snapped to a grid of
+    ``quantization`` degrees; rings that collapse to fewer than three
+    points are dropped, and so are features left without any polygon.
+    """
+    keys, starts, ends, ring_polygon, polygon_feature, width, translate = _quantized_rings(
+        gdf.geometry.values, quantization
+    )
+    valid = (ends - starts) >= 3
+    junction = _junctions(keys, starts, ends, valid)
+
+    arc_index, arcs = {}, []
+
+    def arc_ref(points):
+        """Index of an arc, or ``~index`` when an existing arc runs the other way."""
+        forward = points.tobytes()
+        if forward in arc_index:
+            return arc_index[forward]
+        backward = points[::-1].tobytes()
+        if backward in arc_index:
+            return ~arc_index[backward]
+        arc_index[forward] = len(arcs)
+        arcs.append(points)
+        return len(arcs) - 1
+
+    # Ring arcs, grouped per polygon; a polygon whose exterior collapsed is dropped
+    polygon_rings = [[] for _ in range(len(polygon_feature))]
+    for r in range(len(starts)):
+        polygon = ring_polygon[r]
+        is_exterior = r == 0 or ring_polygon[r - 1] != polygon
+        if not valid[r] or (not is_exterior and not polygon_rings[polygon]):
+            continue
+        points = keys[starts[r]:ends[r]]
+        cuts = np.flatnonzero(junction[starts[r]:ends[r]])
+        if len(cuts) == 0:
+            # Isolated ring: start at its smallest point so shared rings match
+            start = int(np.argmin(points))
+            ring = [arc_ref(np.concatenate((points[start:], points[:start + 1])))]
+        else:
+            start = int(cuts[0])
+            points = np.concatenate((points[start:], points[:start + 1]))
+            bounds = (cuts - start).tolist() + [len(points) - 1]
+            ring = [arc_ref(points[a:b + 1]) for a, b in zip(bounds[:-1], bounds[1:])]
+        polygon_rings[polygon].append(ring)
+
+    feature_polygons = [[] for _ in range(len(gdf))]
+    for polygon, rings in enumerate(polygon_rings):
+        if rings:
+            feature_polygons[polygon_feature[polygon]].append(rings)
+
+    kept = np.flatnonzero([bool(polygons) for polygons in feature_polygons])
+    geometries = []
+    for i in kept:
+        polygons = feature_polygons[i]
+        if len(polygons) == 1:
+            geometries.append({"type": "Polygon", "arcs": polygons[0]})
+        else:
+            geometries.append({"type": "MultiPolygon", "arcs": polygons})
+
+    # Delta-encode every arc on the grid in one pass
+    lengths = np.fromiter((len(points) for points in arcs), dtype=np.intp, count=len(arcs))
+    offsets = np.r_[0, np.cumsum(lengths)]
+    points = np.concatenate(arcs) if arcs else np.empty(0, dtype=np.int64)
+    grid = np.column_stack(np.divmod(points, width))
+    deltas = np.diff(grid, axis=0, prepend=grid[:1] * 0)
+    deltas[offsets[:-1]] = grid[offsets[:-1]]
+    pairs = deltas.tolist()
+    arc_list = [pairs[a:b] for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+    header = {
+        "type": "Topology",
+        "transform": {"scale": [quantization, quantization], "translate": [float(v) for v in translate]},
+        "objects": {OBJECT_NAME: {"type": "GeometryCollection", "geometries": geometries}},
+    }
+    columns = [c for c in dict.fromkeys(fields) if c in gdf.columns]
+    return (
+        json.dumps(header, separators=(",", ":"))[:-1]
+        + ',"columns":' + _column_table(gdf.iloc[kept], columns)
+        + ',"arcs":' + json.dumps(arc_list, separators=(",", ":")) + "}"
+    )
+
+
+def _column_table(frame, columns, category_max_ratio=0.5):
+    """
+    JSON object of ``{column: {"values": [...]}}`` for the feature properties.
+
+    Strings repeated across rows are sent as ``{"categories": [...],
+    "codes": [...]}`` (code -1 is null). float32 columns are written at
+    their shortest round-tripping precision instead of float64 noise.
+    """
+    parts = []
+    for column in columns:
+        values = frame[column]
+        if pd.api.types.is_numeric_dtype(values):
+            if values.dtype == np.float32:
+                values = pd.Series(values.to_numpy().astype(str).astype(np.float64))
+            encoded = '{"values":' + values.to_json(orient="values", double_precision=15) + "}"
+        elif len(values) and values.nunique(dropna=True) <= category_max_ratio * len(values):
+            codes, categories = pd.factorize(values)
+            encoded = '{"categories":' + json.dumps(list(map(str, categories)), ensure_ascii=False) + ',"codes":' + json.dumps(codes.tolist()) + "}"
+        else:
+            encoded = '{"values":' + json.dumps([None if pd.isna(v) else str(v) for v in values], ensure_ascii=False) + "}"
+        parts.append(json.dumps(column) + ":" + encoded)
+    return "{" + ",".join(parts) + "}"
+
+
+# ====================================================================
+# Map Layer
+# ====================================================================
+class TopoJsonLayer(JSCSSMixin, Layer):
+    """
+    Map layer drawn from a TopoJSON string produced by ``encode``.
+
+    ``style`` and ``highlight`` are ``(base, color_keys)`` specs whose
+    color keys take each feature's ``color_property``. Tooltips are built
+    in the browser from ``fields`` and ``aliases``.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var style = {{ this.style }}, highlight = {{ this.highlight }};
+            var fields = {{ this.fields }}, aliases = {{ this.aliases }};
+            var paint = function(spec, feature) {
+                var s = Object.assign({}, spec[0]);
+                spec[1].forEach(function(k) { s[k] = feature.properties[{{ this.color_property }}]; });
+                return s;
+            };
+            var escape = function(value) {
+                return String(value).replace(/[&<>"']/g, function(c) { return '&#' + c.charCodeAt(0) + ';'; });
+            };
+            {% if this.tooltip_style %}
+            if (!document.getElementById('atlas-tooltip-style')) {
+                var css = document.createElement('style');
+                css.id = 'atlas-tooltip-style';
+                css.innerHTML = '.atlas-tooltip {' + {{ this.tooltip_style }} + '}';
+                document.head.appendChild(css);
+            }
+            {% endif %}
+            var topology = {{ this.data }};
+            var collection = topojson.feature(topology, topology.objects.{{ this.object_name }});
+            var columns = topology.columns || {};
+            collection.features.forEach(function(feature, i) {
+                var properties = {};
+                Object.keys(columns).forEach(function(name) {
+                    var column = columns[name];
+                    properties[name] = column.categories ?
+                        (column.codes[i] < 0 ? null : column.categories[column.codes[i]]) : column.values[i];
+                });
+                feature.properties = properties;
+            });
+            var layer = L.geoJson(collection, {
+                style: function(feature) { return paint(style, feature); },
+                onEachFeature: function(feature, region) {
+                    if (fields.length) {
+                        var rows = fields.map(function(field, i) {
+                            var value = feature.properties[field];
+                            value = value === null || value === undefined ? '' :
+                                (typeof value === 'number' ? value.toLocaleString() : escape(value));
+                            return '<tr><th>' + escape(aliases[i]) + '</th><td>' + value + '</td></tr>';
+                        });
+                        region.bindTooltip('<table>' + rows.join('') + '</table>', {
+                            sticky: false, className: {{ this.tooltip_class }}
+                        });
+                    }
+                    if (highlight) {
+                        region.on('mouseover', function() { region.setStyle(paint(highlight, feature)); });
+                        region.on('mouseout', function() { layer.resetStyle(region); });
+                    }
+                }
+            });
+            return layer;
+        })().addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+
+    default_js = [
+        ("topojson-client", "https://cdn.jsdelivr.net/npm/topojson-client@3/dist/topojson-client.min.js"),
+    ]
+
+    def __init__(self, data, style, highlight=None, fields=(), aliases=(), name=None,
+                 color_property=None, tooltip_style=None):
+        super().__init__(name=name, overlay=True, control=True, show=True)
+        self._name = "TopoJsonLayer"
+        self.data = data
+        self.object_name = OBJECT_NAME
+        self.style = json.dumps(style)
+        self.highlight = json.dumps(highlight)
+        self.fields = json.dumps(list(fields))
+        self.aliases = json.dumps(list(aliases))
+        self.color_property = json.dumps(color_property)
+        self.tooltip_style = json.dumps(" ".join(tooltip_style.split())) if tooltip_style else None
+        self.tooltip_class = json.dumps("atlas-tooltip" if tooltip_style else "")
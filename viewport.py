@@ -0,0 +1,223 @@
+"""
+Viewport culling for large region layers.
+
+When a selection holds more regions than ``VIEWPORT_MIN_FEATURES``, the
+built map carries no region layer. Each rerun looks up the regions whose
+bounding boxes meet the map bounds reported by ``st_folium`` (plus a
+margin), drops regions smaller than a pixel at the current zoom, and
+sends only the ones the browser does not have yet. The browser appends
+each delta to one persistent GeoJSON layer, so panning ships the newly
+exposed regions and the page payload stays bounded by what is on screen.
+"""
+import hashlib
+import json
+import math
+import os
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+from branca.element import MacroElement
+from jinja2 import Template
+
+import geometry
+import map_payload
+
+# Selections at or below this size keep the single embedded layer
+VIEWPORT_MIN_FEATURES = int(os.environ.get("ATLAS_VIEWPORT_MIN_FEATURES", "3000"))
+
+# Extra share of the viewport width/height fetched on every side
+VIEWPORT_MARGIN = 0.25
+
+# Regions whose longest side is under this many pixels are not drawn
+MIN_FEATURE_PX = 1.0
+
+LABEL_COLUMN = "label"
+
+
+def culling_enabled(n_features, tile_mode=False):
+    """True when a layer of ``n_features`` regions should be sent by viewport."""
+    return not tile_mode and n_features > VIEWPORT_MIN_FEATURES
+
+
+# ====================================================================
+# Bounds
+# ====================================================================
+def bounds_from_state(map_state):
+    """``(minx, miny, maxx, maxy)`` from an ``st_folium`` return value, or ``None``."""
+    bounds = (map_state or {}).get("bounds") or {}
+    south_west, north_east = bounds.get("_southWest") or {}, bounds.get("_northEast") or {}
+    values = (south_west.get("lng"), south_west.get("lat"), north_east.get("lng"), north_east.get("lat"))
+    if any(v is None for v in values):
+        return None
+    return tuple(float(v) for v in values)
+
+
+def initial_bounds(center, zoom, width_px=geometry.MAP_WIDTH_PX, height_px=geometry.MAP_HEIGHT_PX):
+    """Approximate bounds a map opened at ``center`` and ``zoom`` shows on screen."""
+    lat, lon = center
+    scale = geometry.TILE_SIZE_PX * 2 ** zoom
+    half_lon = width_px / 2 * 360.0 / scale
+
+    # Half the height in mercator units, converted back to latitudes
+    half_y = height_px / 2 * 2 * math.pi / scale
+    y = math.log(math.tan(math.pi / 4 + math.radians(max(min(lat, 85.0), -85.0)) / 2))
+    miny, maxy = (math.degrees(2 * math.atan(math.exp(v)) - math.pi / 2) for v in (y - half_y, y + half_y))
+    return lon - half_lon, miny, lon + half_lon, maxy
+
+
+def union_bounds(*bounds):
+    """Smallest bounds covering every non-``None`` argument."""
+    bounds = [b for b in bounds if b is not None]
+    return (
+        min(b[0] for b in bounds), min(b[1] for b in bounds),
+        max(b[2] for b in bounds), max(b[3] for b in bounds),
+    )
+
+
+def expand_bounds(bounds, margin=VIEWPORT_MARGIN):
+    """Grow ``bounds`` by ``margin`` times its width and height on every side."""
+    minx, miny, maxx, maxy = bounds
+    dx, dy = (maxx - minx) * margin, (maxy - miny) * margin
+    return minx - dx, miny - dy, maxx + dx, maxy + dy
+
+
+def visible_rows(region_index, bounds, shown, zoom, min_feature_px=MIN_FEATURE_PX):
+    """
+    Sorted row positions of the selection's regions inside ``bounds``.
+
+    ``shown`` is a boolean mask over all dataset rows marking the
+    selection; regions smaller than ``min_feature_px`` at ``zoom`` are left
+    out because they would not be visible.
+    """
+    rows = region_index.query_bounds(bounds)
+    rows = rows[shown[rows]]
+    degrees_per_px = 360.0 / (geometry.TILE_SIZE_PX * 2 ** zoom)
+    return rows[region_index.extents[rows] >= min_feature_px * degrees_per_px]
+
+
+# ====================================================================
+# Sent Features
+# ====================================================================
+def layer_key(map_key, level):
+    """Identifier of the browser layer for one built map at one geometry level."""
+    return hashlib.sha1(repr((map_key, level)).encode("utf-8")).hexdigest()[:16]
+
+
+class SentRegions:
+    """
+    Row positions already sent to one browser layer, kept in session state.
+
+    Each instance gets its own layer ``key``, so starting over (a new map,
+    level or mount) also makes the browser drop the regions it holds.
+    """
+
+    def __init__(self, map_key, level, n_rows):
+        self.map_key = map_key
+        self.level = level
+        self.key = f"{layer_key(map_key, level)}-{uuid.uuid4().hex[:8]}"
+        self.sent = np.zeros(n_rows, dtype=bool)
+
+    def __len__(self):
+        return int(self.sent.sum())
+
+    def take_new(self, rows):
+        """Return the ``rows`` not sent yet and mark them as sent."""
+        new = rows[~self.sent[rows]]
+        self.sent[new] = True
+        return new
+
+
+# ====================================================================
+# Map Layer
+# ====================================================================
+class _ViewportRegions(MacroElement):
+    """Appends a GeoJSON delta to the page's persistent region layer, recreating it for a new key."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this.map.get_name() }};
+            var layer = window.atlasRegionLayer;
+            if (!layer || layer.atlasKey !== {{ this.key }}) {
+                if (layer) { map.removeLayer(layer); }
+                if (!document.getElementById('atlas-tooltip-style')) {
+                    var css = document.createElement('style');
+                    css.id = 'atlas-tooltip-style';
+                    css.innerHTML = '.atlas-tooltip {' + {{ this.tooltip_style }} + '}';
+                    document.head.appendChild(css);
+                }
+                var style = {{ this.style }}, highlight = {{ this.highlight }};
+                var paint = function(spec, feature) {
+                    var s = Object.assign({}, spec[0]);
+                    spec[1].forEach(function(k) { s[k] = feature.properties.{{ this.fill_column }}; });
+                    return s;
+                };
+                layer = L.geoJson(null, {
+                    style: function(feature) { return paint(style, feature); },
+                    onEachFeature: function(feature, region) {
+                        var label = feature.properties.{{ this.label_column }};
+                        if (label) { region.bindTooltip(label, {sticky: false, className: 'atlas-tooltip'}); }
+                        region.on('mouseover', function() { region.setStyle(paint(highlight, feature)); });
+                        region.on('mouseout', function() { layer.resetStyle(region); });
+                    }
+                }).addTo(map);
+                layer.atlasKey = {{ this.key }};
+                window.atlasRegionLayer = layer;
+            }
+            layer.addData({{ this.data }});
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, map_, key, data, style, highlight, tooltip_style):
+        super().__init__()
+        self._name = "ViewportRegions"
+        self.map = map_
+        self.key = json.dumps(key)
+        self.data = data
+        self.style = json.dumps(style)
+        self.highlight = json.dumps(highlight)
+        self.tooltip_style = json.dumps(" ".join(tooltip_style.split()))
+        self.fill_column = map_payload.FILL_COLOR_COLUMN
+        self.label_column = LABEL_COLUMN
+
+
+def region_delta(m, layer, geometries, rows, key, tooltip_style=""):
+    """
+    Feature group adding ``rows`` to the page's region layer.
+
+    ``layer`` is the ``viewport`` entry of ``pipeline.build_map``'s info and
+    ``geometries`` the pyramid level to draw at. Returns ``(group,
+    payload_bytes)``; pass the group to ``st_folium`` as
+    ``feature_group_to_add``.
+    """
+    import folium
+    import geopandas as gpd
+
+    frame = gpd.GeoDataFrame(layer['attributes'].loc[rows], geometry=geometries.loc[rows].values, crs=geometries.crs)
+    data = map_payload.build_geojson_payload(frame, [LABEL_COLUMN])
+
+    group = folium.FeatureGroup(name="Agricultural Products", control=False)
+    group.add_child(_ViewportRegions(m, key, data, layer['style'], layer['highlight'], tooltip_style))
+    return group, map_payload.payload_size(data)
+
+
+@contextmanager
+def restored(m):
+    """
+    Undo what rendering a delta leaves on the shared map.
+
+    ``st_folium`` adds the feature group to ``m`` and registers its scripts
+    on the page root; both are dropped on exit so cached maps neither grow
+    nor show one session's regions to another.
+    """
+    root = m.get_root()
+    children, scripts = set(m._children), set(root.script._children)
+    try:
+        yield
+    finally:
+        for name in set(m._children) - children:
+            del m._children[name]
+        for name in set(root.script._children) - scripts:
+            del root.script._children[name]